@@ -1,36 +1,214 @@
-from flask import Flask, render_template, request, flash
-from scrape_ig import run_instagram_scraper, save_scraped_data
-from download_content import process_instagram_data as download_process
+from flask import Flask, Response, render_template, request, flash, jsonify, url_for
+from scrape_ig import run_instagram_scraper, save_scraped_data, run_input, INCREMENTAL_SCRAPING
+from download_content import (
+    process_instagram_data as download_process, fetch_recent_blob_names, missing_media_ids, DOWNLOAD_WORKERS,
+)
+from preprocess_media import preprocess_media, PREPROCESS_MEDIA
 from semantic_extraction import process_instagram_data as semantic_process, universal_prompt
+from streaming_pipeline import run_streaming_pipeline
+from jobs import JobQueue, SUCCEEDED, FAILED, JOB_WORKERS
+from resources import health_check, get_http_session
+import tracing
 import os
+import json
+import time
 from dotenv import load_dotenv
 
 load_dotenv('.env.development.local')
 
+# Overlap scraping, downloads and extraction instead of running them one after another
+STREAMING_PIPELINE = os.getenv("STREAMING_PIPELINE", "true").lower() == "true"
+# Seconds between job store checks on an open event stream
+JOB_EVENTS_INTERVAL = float(os.getenv("JOB_EVENTS_INTERVAL", "0.25"))
+# Longest a single event stream stays open before the browser has to reconnect
+JOB_EVENTS_MAX_SECONDS = float(os.getenv("JOB_EVENTS_MAX_SECONDS", "30"))
+# Delay before the browser reconnects once a stream ends
+JOB_EVENTS_RETRY_MS = int(os.getenv("JOB_EVENTS_RETRY_MS", "2000"))
+
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
+# Pipeline stages, run in order by the background job workers
+def scrape_stage(context):
+    # Run the Instagram scraper with the username
+    context["run"] = run_instagram_scraper(context["username"])
+
+def save_stage(context):
+    # Save scraped data, keeping the ids of posts not seen in earlier runs
+    context["new_ids"] = save_scraped_data(context["run"])
+
+def download_stage(context):
+    # Download the new posts, plus any post in the digest window whose media never reached storage
+    ids = set(context["new_ids"]) | set(missing_media_ids(context["username"], run_input["resultsLimit"]))
+    context["downloads"] = download_process(context["username"], ids=sorted(ids))
+
+def preprocess_stage(context):
+    # Pick the user's latest posts and, if enabled, shrink them before they go to the model
+    blob_names = fetch_recent_blob_names(context["username"], run_input["resultsLimit"])
+    if PREPROCESS_MEDIA:
+        blob_names = preprocess_media(blob_names)
+    context["blob_names"] = blob_names
+
+def extract_stage(context):
+    # Process content and generate summary; unchanged posts hit the extraction cache
+    context["summary"] = semantic_process(universal_prompt, blob_names=context["blob_names"],
+                                          on_partial=context["on_partial"])
+
+def pipeline_stage(context):
+    # Scrape, download and summarise with every stage running at once
+    context["summary"] = run_streaming_pipeline(context["username"], universal_prompt,
+                                                on_partial=context["on_partial"],
+                                                on_progress=context["on_progress"])
+
+if STREAMING_PIPELINE:
+    stages = [("pipeline", pipeline_stage)]
+else:
+    stages = [
+        ("scrape", scrape_stage),
+        ("save", save_stage),
+        ("download", download_stage),
+        ("preprocess", preprocess_stage),
+        ("extract", extract_stage),
+    ]
+
+job_workers = JOB_WORKERS
+if not INCREMENTAL_SCRAPING and job_workers > 1:
+    # Every non-incremental job empties instagram_data first, which would wipe the rows of a job running alongside it
+    app.logger.warning("INCREMENTAL_SCRAPING is off, so digest jobs run one at a time")
+    job_workers = 1
+job_queue = JobQueue(stages, workers=job_workers)
+# One connection per download worker of every job that can run at once
+get_http_session(DOWNLOAD_WORKERS * job_workers)
+
+@app.before_request
+def start_job_queue():
+    # Started by the first request rather than at import, so processes that merely import
+    # this module (reloader parents, multiprocessing children) never pick up jobs
+    job_queue.start()
+
+def wants_json():
+    return request.accept_mimetypes.best == "application/json" or request.is_json
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    summary = None
+    job_id = None
     if request.method == 'POST':
-        username = request.form['instagram_username']
-        try:
-            # Run the Instagram scraper with the username
-            run = run_instagram_scraper(username)
-            
-            # Save scraped data
-            save_scraped_data(run)
-            
-            # Download and store content
-            download_process(username)  # Assuming you update this function to accept username
-            
-            # Process content and generate summary
-            summary = semantic_process(universal_prompt)  # Removed username parameter
-        except Exception as e:
-            flash(f"An error occurred: {str(e)}")
-    
-    return render_template('index.html', summary=summary)
+        username = request.form.get('instagram_username') or (request.get_json(silent=True) or {}).get('instagram_username')
+        if not username:
+            if wants_json():
+                return jsonify({"error": "instagram_username is required"}), 400
+            flash("An error occurred: instagram_username is required")
+        else:
+            job_id = job_queue.submit(username)
+            if wants_json():
+                return jsonify({
+                    "job_id": job_id,
+                    "status_url": url_for('job_status', job_id=job_id),
+                    "summary_url": url_for('job_summary', job_id=job_id),
+                    "events_url": url_for('job_events', job_id=job_id),
+                }), 202
+
+    return render_template('index.html', job_id=job_id)
+
+def job_payload(job):
+    return {
+        "job_id": job["id"],
+        "username": job["username"],
+        "status": job["status"],
+        # A list rather than an object so the stage order survives JSON key sorting
+        "stages": [dict(name=name, **stage) for name, stage in job["stages"].items()],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    return jsonify(job_payload(job))
+
+@app.route('/jobs/<job_id>/summary', methods=['GET'])
+def job_summary(job_id):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    if job["status"] == FAILED:
+        return jsonify({"job_id": job["id"], "status": job["status"], "error": job["error"]}), 500
+    if job["status"] != SUCCEEDED:
+        return jsonify({"job_id": job["id"], "status": job["status"]}), 202
+    return jsonify({"job_id": job["id"], "status": job["status"], "summary": job["summary"]})
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events: `status` on every stage change, `summary` as the digest is written, then `done`.
+
+    The first `summary` event on a connection carries the full `text` so far; later
+    ones carry only the new `delta`, unless the text was restarted.
+
+    A connection is only held open while the digest text is being written, and
+    for at most JOB_EVENTS_MAX_SECONDS. Otherwise the response ends after the
+    current status and EventSource reconnects after JOB_EVENTS_RETRY_MS. Waiting
+    through the scrape, download and extract stages therefore costs one short
+    request every couple of seconds instead of a pinned worker.
+    """
+    if job_queue.store.get(job_id) is None:
+        return jsonify({"error": "job not found"}), 404
+
+    def generate():
+        yield f"retry: {JOB_EVENTS_RETRY_MS}\n\n"
+        deadline = time.monotonic() + JOB_EVENTS_MAX_SECONDS
+        sent_state = None
+        sent_summary = None
+        while True:
+            job = job_queue.store.get(job_id)
+            if job is None:
+                yield server_sent_event("done", {"status": FAILED, "error": "job not found"})
+                return
+            state = (job["status"], job["stages"], job["error"])
+            if state != sent_state:
+                yield server_sent_event("status", job_payload(job))
+                sent_state = state
+            summary = job["summary"] or ""
+            if summary != (sent_summary or ""):
+                if sent_summary is not None and summary.startswith(sent_summary):
+                    yield server_sent_event("summary", {"delta": summary[len(sent_summary):]})
+                else:
+                    yield server_sent_event("summary", {"text": summary})
+                sent_summary = summary
+            if job["status"] in (SUCCEEDED, FAILED):
+                yield server_sent_event("done", {"status": job["status"], "error": job["error"]})
+                return
+            if not summary or time.monotonic() >= deadline:
+                return
+            time.sleep(JOB_EVENTS_INTERVAL)
+
+    # Keep reverse proxies from buffering the stream
+    return Response(generate(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/jobs/<job_id>/report', methods=['GET'])
+def job_report(job_id):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "job not found"}), 404
+    if job["report"] is None:
+        return jsonify({"job_id": job["id"], "status": job["status"]}), 202
+    return jsonify(job["report"])
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(tracing.registry.prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    status = health_check()
+    healthy = all(value == "ok" for value in status.values())
+    return jsonify(status), 200 if healthy else 503
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
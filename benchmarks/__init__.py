@@ -0,0 +1 @@
+"""Benchmark harness and in-memory fakes for the digest pipeline."""
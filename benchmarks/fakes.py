@@ -0,0 +1,306 @@
+"""In-memory stand-ins for Apify, Postgres, the Instagram CDN, GCS and Gemini.
+
+Each fake sleeps for a configurable latency so the pipeline's concurrency,
+batching and caching show up in wall-clock time without any network access.
+"""
+import base64
+import hashlib
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from google.api_core import exceptions as google_exceptions
+from storage_backend import StoredObject
+
+class FakeApifyClient:
+    """Serves `posts_per_user` generated posts for any username, newest first.
+
+    Runs started with `start` publish their items evenly over `actor_latency`,
+    so streaming consumers see them arrive while the run is still going.
+    """
+
+    def __init__(self, posts_per_user=12, video_ratio=0.5, actor_latency=2.0, cdn_host="cdn.fake"):
+        self.posts_per_user = posts_per_user
+        self.video_ratio = video_ratio
+        self.actor_latency = actor_latency
+        self.cdn_host = cdn_host
+        self._datasets = {}
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def actor(self, name):
+        return SimpleNamespace(call=self._call, start=self._start)
+
+    def _call(self, run_input):
+        time.sleep(self.actor_latency)
+        return self._create_dataset(run_input)
+
+    def _start(self, run_input):
+        run = self._create_dataset(run_input)
+        run["id"] = run["defaultDatasetId"]
+        with self._lock:
+            self._runs[run["id"]] = time.monotonic()
+        return run
+
+    def run(self, run_id):
+        started = self._runs[run_id]
+        finished = time.monotonic() - started >= self.actor_latency
+        return SimpleNamespace(get=lambda: {"id": run_id, "status": "SUCCEEDED" if finished else "RUNNING"})
+
+    def _create_dataset(self, run_input):
+        username = run_input["username"][0].lstrip("@").lower()
+        newer_than = run_input.get("onlyPostsNewerThan")
+        now = datetime(2024, 6, 1)
+        items = []
+        for index in range(self.posts_per_user):
+            timestamp = now - timedelta(days=index)
+            if newer_than and timestamp.isoformat() <= newer_than:
+                continue
+            is_video = random.Random(f"{username}-{index}").random() < self.video_ratio
+            media_url = f"https://{self.cdn_host}/{username}/{index}.{'mp4' if is_video else 'jpg'}"
+            items.append({
+                "ownerUsername": username,
+                "caption": f"Post {index} by {username}",
+                "url": f"https://www.instagram.com/p/{username}-{index}/",
+                "timestamp": timestamp.isoformat(),
+                "videoUrl": media_url if is_video else None,
+                "displayUrl": None if is_video else media_url,
+            })
+        dataset_id = f"dataset-{username}-{time.monotonic_ns()}"
+        with self._lock:
+            self._datasets[dataset_id] = items
+        return {"defaultDatasetId": dataset_id}
+
+    def dataset(self, dataset_id):
+        return SimpleNamespace(
+            iterate_items=lambda: iter(self._datasets[dataset_id]),
+            list_items=lambda offset=0, limit=None: SimpleNamespace(items=self._visible(dataset_id)[offset:]),
+        )
+
+    def _visible(self, dataset_id):
+        items = self._datasets[dataset_id]
+        started = self._runs.get(dataset_id)
+        if started is None or not items:
+            return items
+        elapsed = time.monotonic() - started
+        return items[:min(len(items), int(len(items) * elapsed / self.actor_latency))]
+
+class FakeStore:
+    """Replaces the instagram_store functions with an in-memory table.
+
+    `query_latency` is charged once per call, like a database round trip.
+    """
+
+    def __init__(self, query_latency=0.02):
+        self.query_latency = query_latency
+        self.rows = []
+        self.high_water_marks = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def migrate_schema(self):
+        time.sleep(self.query_latency)
+
+    def truncate_posts(self):
+        time.sleep(self.query_latency)
+        with self._lock:
+            self.rows.clear()
+
+    def get_high_water_mark(self, username):
+        time.sleep(self.query_latency)
+        return self.high_water_marks.get(username.lstrip("@").lower())
+
+    def insert_posts(self, items, track_high_water_marks=True, batch_size=500):
+        return [row["id"] for rows in self.stream_insert_posts(items, track_high_water_marks, batch_size) for row in rows]
+
+    def stream_insert_posts(self, items, track_high_water_marks=True, batch_size=500):
+        items = list(items)
+        for start in range(0, len(items), batch_size):
+            time.sleep(self.query_latency)
+            new_rows = []
+            with self._lock:
+                known = {row["url"]: row for row in self.rows}
+                for item in items[start:start + batch_size]:
+                    if item["url"] in known:
+                        # Refresh the signed media urls, like the upsert does
+                        known[item["url"]].update(caption=item.get("caption"), video_url=item.get("videoUrl"),
+                                                  display_url=item.get("displayUrl"))
+                        continue
+                    row = {
+                        "id": self._next_id,
+                        "username": item.get("ownerUsername"),
+                        "caption": item.get("caption"),
+                        "url": item.get("url"),
+                        "timestamp": datetime.fromisoformat(item["timestamp"]),
+                        "video_url": item.get("videoUrl"),
+                        "display_url": item.get("displayUrl"),
+                    }
+                    self._next_id += 1
+                    self.rows.append(row)
+                    known[row["url"]] = row
+                    new_rows.append(dict(row))
+            yield new_rows
+        if track_high_water_marks:
+            with self._lock:
+                for row in self.rows:
+                    username = (row["username"] or "").lower()
+                    mark = self.high_water_marks.get(username)
+                    if mark is None or row["timestamp"] > mark[0]:
+                        self.high_water_marks[username] = (row["timestamp"], row["url"])
+
+    def fetch_user_posts(self, username, limit=None, since=None, ids=None):
+        time.sleep(self.query_latency)
+        username = username.lstrip("@").lower()
+        with self._lock:
+            rows = [dict(row) for row in self.rows if (row["username"] or "").lower() == username]
+        if since is not None:
+            rows = [row for row in rows if row["timestamp"] > since]
+        if ids is not None:
+            wanted = set(ids)
+            rows = [row for row in rows if row["id"] in wanted]
+        rows.sort(key=lambda row: row["timestamp"], reverse=True)
+        return rows[:limit] if limit is not None else rows
+
+class FakeResponse:
+    def __init__(self, size, latency, bandwidth):
+        self.size = size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.status_code = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        time.sleep(self.latency)
+        sent = 0
+        while sent < self.size:
+            chunk = min(chunk_size, self.size - sent)
+            time.sleep(chunk / self.bandwidth)
+            sent += chunk
+            yield b"\0" * chunk
+
+class FakeSession:
+    """CDN stand-in: first byte after `latency` seconds, then `bandwidth` bytes/second."""
+
+    def __init__(self, latency=0.3, bandwidth=20 * 1024 * 1024, video_size=8 * 1024 * 1024, image_size=300 * 1024):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.video_size = video_size
+        self.image_size = image_size
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        size = self.video_size if url.endswith(".mp4") else self.image_size
+        return FakeResponse(size, self.latency, self.bandwidth)
+
+    def close(self):
+        pass
+
+class FakeWriter:
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self.size = 0
+        self.checksum = hashlib.md5()
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        self.checksum.update(chunk)
+
+    def close(self):
+        # One round trip per upload chunk, then the bytes on the wire
+        chunks = max(1, -(-self.size // self.storage.chunk_size))
+        time.sleep(chunks * self.storage.latency + self.size / self.storage.bandwidth)
+        with self.storage.lock:
+            self.storage.objects[self.name] = StoredObject(
+                self.name, self.size, base64.b64encode(self.checksum.digest()).decode()
+            )
+
+    def abort(self):
+        pass
+
+class FakeStorage:
+    """GCS stand-in that keeps object metadata only; reads return zero bytes of the stored size."""
+
+    name = "fake"
+    supports_uri = True
+
+    def __init__(self, latency=0.05, bandwidth=50 * 1024 * 1024, chunk_size=8 * 1024 * 1024):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.chunk_size = chunk_size
+        self.objects = {}
+        self.lock = threading.Lock()
+
+    def uri(self, name):
+        return f"gs://fake-bucket/{name}"
+
+    def open_writer(self, name, content_type):
+        return FakeWriter(self, name)
+
+    def stat(self, name):
+        time.sleep(self.latency)
+        with self.lock:
+            return self.objects.get(name)
+
+    def list(self, prefix):
+        time.sleep(self.latency)
+        with self.lock:
+            return sorted((stored for name, stored in self.objects.items() if name.startswith(prefix)),
+                          key=lambda stored: stored.name)
+
+    def read_bytes(self, name):
+        stored = self.stat(name)
+        time.sleep(stored.size / self.bandwidth)
+        return b"\0" * stored.size
+
+    def delete(self, name):
+        with self.lock:
+            self.objects.pop(name, None)
+
+    def exists(self):
+        return True
+
+class FakeModel:
+    """Gemini stand-in with fixed latency that throttles a fraction of calls with 429s.
+
+    Streamed calls answer their first chunk after `first_chunk_latency` and the
+    remaining `stream_chunks - 1` chunks spread over the rest of `latency`.
+    """
+
+    def __init__(self, latency=4.0, throttle_rate=0.0, output="Summary of one post.",
+                 first_chunk_latency=0.5, stream_chunks=20):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.output = output
+        self.first_chunk_latency = first_chunk_latency
+        self.stream_chunks = stream_chunks
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, stream=False):
+        with self._lock:
+            self.calls += 1
+        if stream:
+            return self._stream()
+        time.sleep(self.latency)
+        if random.random() < self.throttle_rate:
+            raise google_exceptions.ResourceExhausted("429 Quota exceeded (fake)")
+        return SimpleNamespace(text=self.output)
+
+    def _stream(self):
+        time.sleep(min(self.first_chunk_latency, self.latency))
+        if random.random() < self.throttle_rate:
+            raise google_exceptions.ResourceExhausted("429 Quota exceeded (fake)")
+        gap = max(0.0, self.latency - self.first_chunk_latency) / max(1, self.stream_chunks - 1)
+        for index in range(self.stream_chunks):
+            if index:
+                time.sleep(gap)
+            yield SimpleNamespace(text=f"{self.output} " if index < self.stream_chunks - 1 else self.output)
@@ -0,0 +1,157 @@
+"""Drive the full `app.index` flow against local fakes and report throughput.
+
+    python benchmarks/run_benchmark.py --users 4 --posts 12 --model-latency 4
+    python benchmarks/run_benchmark.py --save-baseline bench_baseline.json
+    python benchmarks/run_benchmark.py --baseline bench_baseline.json --tolerance 0.2
+
+With --baseline, exits non-zero when posts/second drops more than --tolerance
+below the saved run, so throughput regressions fail loudly.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2, help="concurrent digest jobs")
+    parser.add_argument("--posts", type=int, default=12, help="posts per profile")
+    parser.add_argument("--video-ratio", type=float, default=0.5)
+    parser.add_argument("--video-size", type=int, default=8 * 1024 * 1024, help="bytes")
+    parser.add_argument("--image-size", type=int, default=300 * 1024, help="bytes")
+    parser.add_argument("--actor-latency", type=float, default=2.0, help="seconds per Apify actor run")
+    parser.add_argument("--db-latency", type=float, default=0.02, help="seconds per database round trip")
+    parser.add_argument("--cdn-latency", type=float, default=0.3, help="seconds to first byte")
+    parser.add_argument("--cdn-bandwidth", type=float, default=20 * 1024 * 1024, help="bytes/second per download")
+    parser.add_argument("--storage-latency", type=float, default=0.05, help="seconds per storage round trip")
+    parser.add_argument("--model-latency", type=float, default=4.0, help="seconds per model call")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of model calls answered with 429")
+    parser.add_argument("--cache", action="store_true", help="enable the extraction cache")
+    parser.add_argument("--pipeline", choices=("streaming", "staged"), default="streaming")
+    parser.add_argument("--digest", choices=("mapreduce", "concat"), default="mapreduce",
+                        help="one streamed newsletter from post summaries, or full outputs joined")
+    parser.add_argument("--report", help="write the full JSON report here")
+    parser.add_argument("--baseline", help="compare against a report saved with --save-baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput drop vs. baseline")
+    parser.add_argument("--save-baseline", help="save this run's summary as a baseline")
+    return parser.parse_args()
+
+def configure_environment(args, workdir):
+    # Module-level settings are read at import time, so set them before importing the app
+    os.environ["JOBS_DB_PATH"] = os.path.join(workdir, "jobs.sqlite3")
+    os.environ["JOB_WORKERS"] = str(max(1, args.users))
+    os.environ["EXTRACTION_CACHE_PATH"] = os.path.join(workdir, "extraction_cache.sqlite3")
+    os.environ["EXTRACTION_CACHE_BACKEND"] = "sqlite" if args.cache else "none"
+    os.environ["INCREMENTAL_SCRAPING"] = "true"
+    os.environ["STREAMING_PIPELINE"] = "true" if args.pipeline == "streaming" else "false"
+    os.environ["SCRAPE_POLL_INTERVAL"] = "0.1"
+    os.environ["MAP_REDUCE_DIGEST"] = "true" if args.digest == "mapreduce" else "false"
+
+def install_fakes(args):
+    import resources
+    import storage_backend
+    import scrape_ig
+    import download_content
+    import semantic_extraction
+    import streaming_pipeline
+    from benchmarks import fakes
+
+    store = fakes.FakeStore(query_latency=args.db_latency)
+    for name in ("migrate_schema", "truncate_posts", "get_high_water_mark", "insert_posts"):
+        setattr(scrape_ig, name, getattr(store, name))
+    download_content.fetch_user_posts = store.fetch_user_posts
+    streaming_pipeline.stream_insert_posts = store.stream_insert_posts
+
+    scrape_ig.client = fakes.FakeApifyClient(args.posts, args.video_ratio, args.actor_latency)
+    resources._http_session = fakes.FakeSession(args.cdn_latency, args.cdn_bandwidth, args.video_size, args.image_size)
+    storage_backend._storage = fakes.FakeStorage(latency=args.storage_latency)
+    model = fakes.FakeModel(latency=args.model_latency, throttle_rate=args.throttle_rate)
+    semantic_extraction.get_model = lambda: model
+    return model
+
+def run_jobs(app_module, users):
+    client = app_module.app.test_client()
+    started = time.monotonic()
+    job_ids = []
+    for index in range(users):
+        response = client.post("/", json={"instagram_username": f"creator{index}"},
+                               headers={"Accept": "application/json"})
+        job_ids.append(response.get_json()["job_id"])
+
+    pending = set(job_ids)
+    while pending:
+        time.sleep(0.1)
+        for job_id in list(pending):
+            if client.get(f"/jobs/{job_id}").get_json()["status"] in ("succeeded", "failed"):
+                pending.discard(job_id)
+    wall_time = time.monotonic() - started
+    jobs = [client.get(f"/jobs/{job_id}").get_json() for job_id in job_ids]
+    reports = [client.get(f"/jobs/{job_id}/report").get_json() for job_id in job_ids]
+    return wall_time, jobs, reports
+
+def summarize(args, wall_time, jobs, reports, model):
+    stages = {}
+    for report in reports:
+        for stage, totals in report["stages"].items():
+            merged = stages.setdefault(stage, {"count": 0, "seconds": 0.0, "bytes": 0, "retries": 0, "errors": 0})
+            for key, value in totals.items():
+                merged[key] += value
+    for merged in stages.values():
+        merged["seconds"] = round(merged["seconds"], 3)
+    # Time from job start until the first digest text could reach the browser
+    first_tokens = [
+        span["started_at"] + span["attributes"]["first_token_seconds"] - report["started_at"]
+        for report in reports for span in report["spans"]
+        if span["stage"] == "reduce" and "first_token_seconds" in span["attributes"]
+    ]
+    posts = args.users * args.posts
+    return {
+        "config": vars(args),
+        "wall_seconds": round(wall_time, 3),
+        "posts": posts,
+        "posts_per_second": round(posts / wall_time, 3) if wall_time else 0.0,
+        "failed_jobs": sum(1 for job in jobs if job["status"] != "succeeded"),
+        "model_calls": model.calls,
+        "first_token_seconds": round(sum(first_tokens) / len(first_tokens), 3) if first_tokens else None,
+        "stages": stages,
+    }
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args, workdir)
+        model = install_fakes(args)
+        import app as app_module
+
+        wall_time, jobs, reports = run_jobs(app_module, args.users)
+        app_module.job_queue.shutdown()
+        summary = summarize(args, wall_time, jobs, reports, model)
+
+    print(json.dumps({key: value for key, value in summary.items() if key != "config"}, indent=2))
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"summary": summary, "runs": reports}, f, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if summary["failed_jobs"]:
+        print(f"{summary['failed_jobs']} job(s) failed", file=sys.stderr)
+        return 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        floor = baseline["posts_per_second"] * (1 - args.tolerance)
+        if summary["posts_per_second"] < floor:
+            print(f"Throughput regression: {summary['posts_per_second']} posts/s "
+                  f"< {floor:.3f} (baseline {baseline['posts_per_second']})", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
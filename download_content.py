@@ -1,84 +1,229 @@
 import os
 import requests
-from google.cloud import storage
-from google.oauth2 import service_account
 from dotenv import load_dotenv
-import psycopg2
 import logging
+import base64
+import hashlib
+import threading
+import time
+import google_crc32c
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Optional
+from urllib.parse import urlparse
+from resources import db_connection, get_http_session
+from storage_backend import get_storage
+from instagram_store import fetch_user_posts
+import tracing
 
 # Load environment variables
 load_dotenv('.env.development.local')
 
-# Database connection setup
-DATABASE_URL = os.getenv("POSTGRES_URL")
+# Download engine setup
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "8"))
+DOWNLOAD_PER_HOST_LIMIT = int(os.getenv("DOWNLOAD_PER_HOST_LIMIT", "4"))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(1024 * 1024)))
+DOWNLOAD_CHUNK_RETRIES = int(os.getenv("DOWNLOAD_CHUNK_RETRIES", "3"))
 
-# Google Cloud Storage setup
-GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
-GCS_CREDENTIALS_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+REQUEST_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Referer': 'https://www.instagram.com/',
+}
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_db_connection():
-    return psycopg2.connect(DATABASE_URL)
+@dataclass
+class DownloadResult:
+    id: int
+    url: str
+    blob_name: str
+    success: bool
+    bytes: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
 
-def fetch_instagram_data():
-    with get_db_connection() as conn:
+class HostLimiter:
+    """Caps the number of in-flight requests to any single host."""
+
+    def __init__(self, limit=DOWNLOAD_PER_HOST_LIMIT):
+        self.limit = limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def for_url(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.limit)
+            return self._semaphores[host]
+
+# One limiter for the whole process, so the per-host cap also holds across concurrent jobs
+shared_host_limiter = HostLimiter()
+
+def fetch_instagram_data(username=None, ids=None):
+    if username:
+        posts = fetch_user_posts(username, ids=ids)
+        return [(post["id"], post["video_url"], post["display_url"]) for post in posts]
+    query = "SELECT id, video_url, display_url FROM instagram_data"
+    params = []
+    if ids is not None:
+        query += " WHERE id = ANY(%s)"
+        params.append(list(ids))
+    with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("SELECT id, video_url, display_url FROM instagram_data")
+            cur.execute(query, params)
             return cur.fetchall()
 
-def download_and_store_content(url, id, is_video):
+def blob_name_for(id, is_video):
     file_extension = '.mp4' if is_video else '.jpg'
-    blob_name = f"instagram_content/{id}{file_extension}"
+    return f"instagram_content/{id}{file_extension}"
 
-    # Initialize GCS client
-    credentials = service_account.Credentials.from_service_account_file(
-        GCS_CREDENTIALS_PATH, scopes=["https://www.googleapis.com/auth/cloud-platform"]
-    )
-    storage_client = storage.Client(credentials=credentials)
-    bucket = storage_client.bucket(GCS_BUCKET_NAME)
-    blob = bucket.blob(blob_name)
+def fetch_window_posts(username, limit):
+    """A user's `limit` most recent posts that have media, newest first."""
+    return [post for post in fetch_user_posts(username, limit=limit) if post["video_url"] or post["display_url"]]
+
+def fetch_recent_blob_names(username, limit):
+    """Blob names for a user's `limit` most recent posts, newest first."""
+    return [blob_name_for(post["id"], bool(post["video_url"])) for post in fetch_window_posts(username, limit)]
+
+def missing_media_ids(username, limit):
+    """Ids of the user's `limit` most recent posts whose media is not in storage.
+
+    Rows and high-water marks are committed before anything is downloaded, so a
+    failed download or an interrupted job would otherwise leave a post stored
+    but never fetched.
+    """
+    storage = get_storage()
+    return [
+        post["id"] for post in fetch_window_posts(username, limit)
+        if storage.stat(blob_name_for(post["id"], bool(post["video_url"]))) is None
+    ]
+
+def stream_content(session, url, chunk_size=DOWNLOAD_CHUNK_SIZE, max_retries=DOWNLOAD_CHUNK_RETRIES):
+    """Yield the body of `url` in chunks, resuming with a Range request if the stream breaks."""
+    offset = 0
+    attempts = 0
+    while True:
+        headers = dict(REQUEST_HEADERS)
+        if offset:
+            headers['Range'] = f"bytes={offset}-"
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=60) as response:
+                response.raise_for_status()
+                # Server ignored the Range header, so skip what we already have
+                skip = offset if offset and response.status_code != 206 else 0
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if skip:
+                        if len(chunk) <= skip:
+                            skip -= len(chunk)
+                            continue
+                        chunk = chunk[skip:]
+                        skip = 0
+                    offset += len(chunk)
+                    yield chunk
+            return
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            attempts += 1
+            if attempts > max_retries:
+                raise
+            logger.warning(f"Stream for {url} interrupted at byte {offset}, resuming (attempt {attempts}): {str(e)}")
+            tracing.add_retry()
+            time.sleep(min(2 ** attempts, 10))
+
+def download_and_store_content(url, id, is_video, session=None, host_limiter=None):
+    with tracing.span("download.item", item=id) as item_span:
+        result = _download_and_store_content(url, id, is_video, session, host_limiter)
+        item_span.bytes = result.bytes
+        item_span.error = result.error
+    return result
+
+def _download_and_store_content(url, id, is_video, session, host_limiter):
+    blob_name = blob_name_for(id, is_video)
+    content_type = "video/mp4" if is_video else "image/jpeg"
+    session = session or get_http_session()
+    host_limiter = host_limiter or shared_host_limiter
+    storage = get_storage()
 
     logger.info(f"Attempting to fetch content for ID {id} with URL: {url}")
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Referer': 'https://www.instagram.com/',
-    }
-    
+    started = time.monotonic()
     try:
-        response = requests.get(url, headers=headers, timeout=60)
-        response.raise_for_status()
+        checksum = hashlib.md5()
+        crc32c = google_crc32c.Checksum()
+        size = 0
+        with host_limiter.for_url(url):
+            writer = storage.open_writer(blob_name, content_type)
+            try:
+                for chunk in stream_content(session, url):
+                    checksum.update(chunk)
+                    crc32c.update(chunk)
+                    size += len(chunk)
+                    writer.write(chunk)
+            except Exception:
+                writer.abort()
+                raise
+            writer.close()
 
-        blob.upload_from_string(response.content)
+        stored = storage.stat(blob_name)
+        if stored is None:
+            raise ValueError(f"{blob_name} is missing after upload")
+        # Compare against whichever hash the backend reports; composite GCS objects have only crc32c
+        if stored.md5_hash:
+            expected, actual = base64.b64encode(checksum.digest()).decode(), stored.md5_hash
+        else:
+            expected, actual = base64.b64encode(crc32c.digest()).decode(), stored.crc32c
+        if actual and actual != expected:
+            storage.delete(blob_name)
+            raise ValueError(f"Checksum mismatch for {blob_name}: expected {expected}, got {actual}")
 
-        gcs_url = f"gs://{GCS_BUCKET_NAME}/{blob_name}"
-        logger.info(f"Stored {'video' if is_video else 'image'} for ID {id} in GCS: {gcs_url}")
-        return True
+        logger.info(f"Stored {'video' if is_video else 'image'} for ID {id} in {storage.name}: {storage.uri(blob_name)}")
+        return DownloadResult(id, url, blob_name, True, size, time.monotonic() - started)
     except requests.RequestException as e:
         logger.error(f"Network error occurred while processing ID {id}: {str(e)}")
+        error = str(e)
     except Exception as e:
         logger.error(f"Unexpected error occurred while processing ID {id}: {str(e)}")
-    return False
-
-def process_instagram_data():
-    rows = fetch_instagram_data()
-    for id, video_url, display_url in rows:
-        if video_url:
-            logger.info(f"Processing video URL for ID {id}: {video_url}")
-            success = download_and_store_content(video_url, id, is_video=True)
-        elif display_url:
-            logger.info(f"Processing image URL for ID {id}: {display_url}")
-            success = download_and_store_content(display_url, id, is_video=False)
-        else:
-            logger.warning(f"No URL found for ID {id}")
-            continue
+        error = str(e)
+    return DownloadResult(id, url, blob_name, False, seconds=time.monotonic() - started, error=error)
 
-        if not success:
-            logger.warning(f"Failed to process content for ID {id}")
+def process_instagram_data(username=None, ids=None, workers=DOWNLOAD_WORKERS):
+    rows = fetch_instagram_data(username, ids)
+    session = get_http_session(workers)
+    host_limiter = shared_host_limiter
+
+    results = []
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download") as executor:
+        futures = []
+        for id, video_url, display_url in rows:
+            if video_url:
+                logger.info(f"Processing video URL for ID {id}: {video_url}")
+                futures.append(executor.submit(tracing.bind(download_and_store_content), video_url, id, True, session, host_limiter))
+            elif display_url:
+                logger.info(f"Processing image URL for ID {id}: {display_url}")
+                futures.append(executor.submit(tracing.bind(download_and_store_content), display_url, id, False, session, host_limiter))
+            else:
+                logger.warning(f"No URL found for ID {id}")
+
+        for future in as_completed(futures):
+            result = future.result()
+            if not result.success:
+                logger.warning(f"Failed to process content for ID {result.id}")
+            results.append(result)
+
+    elapsed = time.monotonic() - started
+    total_bytes = sum(result.bytes for result in results)
+    succeeded = sum(1 for result in results if result.success)
+    throughput = total_bytes / elapsed / 1024 / 1024 if elapsed else 0.0
+    logger.info(
+        f"Downloaded {succeeded}/{len(results)} items ({total_bytes} bytes) in {elapsed:.2f}s "
+        f"with {workers} workers: {throughput:.2f} MiB/s"
+    )
+    results.sort(key=lambda result: result.id)
+    return results
 
 if __name__ == "__main__":
-    process_instagram_data()
\ No newline at end of file
+    process_instagram_data()
@@ -0,0 +1,144 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from dotenv import load_dotenv
+from resources import db_connection
+
+# Load environment variables
+load_dotenv('.env.development.local')
+
+# Cache setup
+EXTRACTION_CACHE_BACKEND = os.getenv("EXTRACTION_CACHE_BACKEND", "sqlite")  # sqlite, postgres or none
+EXTRACTION_CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "/tmp/buildspace_extraction_cache.sqlite3")
+EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", str(30 * 24 * 3600)))  # seconds
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "10000"))
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def cache_key(media_hash, prompt, model_name):
+    """Content-addressed key: the same media, prompt and model always map to the same entry."""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    return hashlib.sha256(f"{media_hash}:{prompt_hash}:{model_name}".encode("utf-8")).hexdigest()
+
+class SqliteCache:
+    """Local on-disk cache. Entries expire after `ttl` seconds and the least recently
+    used ones are evicted once there are more than `max_entries`."""
+
+    def __init__(self, path=EXTRACTION_CACHE_PATH, ttl=EXTRACTION_CACHE_TTL, max_entries=EXTRACTION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS extraction_cache (
+                key TEXT PRIMARY KEY,
+                text TEXT,
+                created_at REAL,
+                accessed_at REAL
+            )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS extraction_cache_accessed_at ON extraction_cache (accessed_at)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT text FROM extraction_cache WHERE key = ? AND created_at > ?", (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE extraction_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, text):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extraction_cache (key, text, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, text, now, now),
+            )
+
+    def evict(self):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM extraction_cache WHERE created_at <= ?", (now - self.ttl,))
+            conn.execute("""
+            DELETE FROM extraction_cache WHERE key IN (
+                SELECT key FROM extraction_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+            """, (self.max_entries,))
+
+class PostgresCache:
+    """Shared cache in the application database, with the same expiry rules as SqliteCache."""
+
+    def __init__(self, ttl=EXTRACTION_CACHE_TTL, max_entries=EXTRACTION_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                CREATE TABLE IF NOT EXISTS extraction_cache (
+                    key TEXT PRIMARY KEY,
+                    text TEXT,
+                    created_at TIMESTAMPTZ DEFAULT now(),
+                    accessed_at TIMESTAMPTZ DEFAULT now()
+                )
+                """)
+                cur.execute("CREATE INDEX IF NOT EXISTS extraction_cache_accessed_at ON extraction_cache (accessed_at)")
+
+    def get(self, key):
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                UPDATE extraction_cache SET accessed_at = now()
+                WHERE key = %s AND created_at > now() - make_interval(secs => %s)
+                RETURNING text
+                """, (key, self.ttl))
+                row = cur.fetchone()
+        return row[0] if row else None
+
+    def set(self, key, text):
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                INSERT INTO extraction_cache (key, text) VALUES (%s, %s)
+                ON CONFLICT (key) DO UPDATE SET text = EXCLUDED.text, created_at = now(), accessed_at = now()
+                """, (key, text))
+
+    def evict(self):
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM extraction_cache WHERE created_at <= now() - make_interval(secs => %s)", (self.ttl,)
+                )
+                cur.execute("""
+                DELETE FROM extraction_cache WHERE key IN (
+                    SELECT key FROM extraction_cache ORDER BY accessed_at DESC OFFSET %s
+                )
+                """, (self.max_entries,))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache():
+    """Return the configured cache backend, or None when caching is disabled."""
+    global _cache
+    with _cache_lock:
+        if _cache is None and EXTRACTION_CACHE_BACKEND != "none":
+            if EXTRACTION_CACHE_BACKEND == "postgres":
+                _cache = PostgresCache()
+            elif EXTRACTION_CACHE_BACKEND == "sqlite":
+                _cache = SqliteCache()
+            else:
+                raise ValueError(f"Unknown EXTRACTION_CACHE_BACKEND: {EXTRACTION_CACHE_BACKEND}")
+            logger.info(f"Using {EXTRACTION_CACHE_BACKEND} extraction cache")
+        return _cache
@@ -0,0 +1,150 @@
+import os
+import random
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from google.api_core import exceptions as google_exceptions
+from dotenv import load_dotenv
+import tracing
+
+# Load environment variables
+load_dotenv('.env.development.local')
+
+# Scheduler setup
+EXTRACTION_MAX_CONCURRENCY = int(os.getenv("EXTRACTION_MAX_CONCURRENCY", "8"))
+EXTRACTION_INITIAL_CONCURRENCY = int(os.getenv("EXTRACTION_INITIAL_CONCURRENCY", "4"))
+EXTRACTION_RATE = float(os.getenv("EXTRACTION_RATE", "2.0"))  # requests per second
+EXTRACTION_MAX_RETRIES = int(os.getenv("EXTRACTION_MAX_RETRIES", "6"))
+
+# Errors that mean "slow down" rather than "this item is broken"
+THROTTLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class TokenBucket:
+    """Blocking token bucket that smooths request starts to `rate` per second."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AdaptiveLimiter:
+    """Concurrency limit that grows by one per window of successes and halves on throttling."""
+
+    def __init__(self, initial, maximum, minimum=1):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = max(minimum, min(initial, maximum))
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= self.limit:
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                logger.info(f"Raised extraction concurrency to {self.limit}")
+                self._condition.notify_all()
+
+    def on_throttle(self):
+        with self._condition:
+            new_limit = max(self.minimum, self.limit // 2)
+            if new_limit != self.limit:
+                logger.warning(f"Throttled by the model API, lowering extraction concurrency to {new_limit}")
+            self.limit = new_limit
+            self._successes = 0
+
+class AdaptiveScheduler:
+    """Runs `fn(item)` calls from any number of threads under a shared rate and concurrency limit.
+
+    Throttling errors shrink the concurrency limit and are retried with jittered
+    exponential backoff; any other error is returned for that item immediately.
+    Each item is traced as one `span_name` span covering all of its attempts.
+    """
+
+    def __init__(self, fn, max_concurrency=EXTRACTION_MAX_CONCURRENCY,
+                 initial_concurrency=EXTRACTION_INITIAL_CONCURRENCY, rate=EXTRACTION_RATE,
+                 max_retries=EXTRACTION_MAX_RETRIES, span_name="schedule.item"):
+        self.fn = fn
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.span_name = span_name
+        self.limiter = AdaptiveLimiter(initial_concurrency, max_concurrency)
+        self.bucket = TokenBucket(rate, capacity=initial_concurrency)
+
+    def call(self, item):
+        """Return `fn(item)`, or the exception it finally raised."""
+        with tracing.span(self.span_name, item=item) as item_span:
+            outcome = self._attempt(item)
+            if isinstance(outcome, Exception):
+                item_span.error = str(outcome)
+            return outcome
+
+    def _attempt(self, item):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            self.limiter.acquire()
+            try:
+                result = self.fn(item)
+            except THROTTLE_ERRORS as e:
+                self.limiter.on_throttle()
+                if attempt == self.max_retries:
+                    return e
+                tracing.add_retry()
+                delay = min(60.0, 2 ** attempt) * random.uniform(0.5, 1.5)
+                logger.warning(f"Throttled on {item} (attempt {attempt + 1}), retrying in {delay:.1f}s: {str(e)}")
+            except Exception as e:
+                return e
+            else:
+                self.limiter.on_success()
+                return result
+            finally:
+                self.limiter.release()
+            time.sleep(delay)
+
+def run_scheduled(fn, items, **options):
+    """Call `fn(item)` for every item concurrently and return outcomes in input order.
+
+    Each outcome is the function's return value, or the exception it finally raised.
+    `options` are passed through to AdaptiveScheduler.
+    """
+    if not items:
+        return []
+    scheduler = AdaptiveScheduler(fn, **options)
+    with ThreadPoolExecutor(max_workers=scheduler.max_concurrency, thread_name_prefix="extract") as executor:
+        return list(executor.map(tracing.bind(scheduler.call), items))
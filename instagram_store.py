@@ -0,0 +1,183 @@
+import os
+from itertools import islice
+from psycopg2.extras import execute_values, RealDictCursor
+from dotenv import load_dotenv
+from resources import db_connection
+
+# Load environment variables
+load_dotenv('.env.development.local')
+
+# Rows sent to Postgres per INSERT statement
+INSERT_BATCH_SIZE = int(os.getenv("INSERT_BATCH_SIZE", "500"))
+
+# Arbitrary key for the advisory lock that serialises concurrent migrations
+MIGRATION_LOCK_ID = 72_110_001
+
+create_table_query = """
+CREATE TABLE IF NOT EXISTS instagram_data (
+    id SERIAL PRIMARY KEY,
+    username TEXT,
+    caption TEXT,
+    url TEXT,
+    timestamp TIMESTAMP,
+    video_url TEXT,
+    display_url TEXT
+)
+"""
+
+# Applied in order, once each; the index into this list is the schema version
+MIGRATIONS = [
+    # 1: unique post url, after dropping duplicates left by earlier full runs
+    [
+        """
+        DELETE FROM instagram_data a USING instagram_data b
+        WHERE a.url = b.url AND a.id > b.id
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS instagram_data_url_key ON instagram_data (url)",
+    ],
+    # 2: per-username high-water mark of the newest post seen
+    [
+        """
+        CREATE TABLE IF NOT EXISTS scrape_state (
+            username TEXT PRIMARY KEY,
+            last_timestamp TIMESTAMP,
+            last_url TEXT,
+            updated_at TIMESTAMP DEFAULT now()
+        )
+        """,
+    ],
+    # 3: indexes for per-username and time-ordered lookups
+    [
+        "CREATE INDEX IF NOT EXISTS instagram_data_username_timestamp_idx ON instagram_data (lower(username), timestamp DESC NULLS LAST)",
+        "CREATE INDEX IF NOT EXISTS instagram_data_timestamp_idx ON instagram_data (timestamp DESC)",
+    ],
+]
+
+INSERT_COLUMNS = ("username", "caption", "url", "timestamp", "video_url", "display_url")
+
+def migrate_schema():
+    """Create instagram_data if needed and apply any migrations not yet recorded."""
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (MIGRATION_LOCK_ID,))
+            cur.execute(create_table_query)
+            cur.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+            cur.execute("SELECT max(version) FROM schema_version")
+            current = cur.fetchone()[0] or 0
+            for version, statements in enumerate(MIGRATIONS, start=1):
+                if version <= current:
+                    continue
+                for statement in statements:
+                    cur.execute(statement)
+                cur.execute("INSERT INTO schema_version (version) VALUES (%s)", (version,))
+                print(f"Applied instagram_data schema migration {version}")
+
+def truncate_posts():
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("TRUNCATE TABLE instagram_data")
+
+def _item_row(item):
+    return (
+        item.get("ownerUsername"),
+        item.get("caption"),
+        item.get("url"),
+        item.get("timestamp"),
+        item.get("videoUrl"),
+        item.get("displayUrl"),
+    )
+
+def _dedupe_by_url(rows):
+    # ON CONFLICT DO UPDATE cannot touch one row twice in a statement, so the last copy of a url wins
+    by_url = {}
+    for row in rows:
+        by_url[row[2] if row[2] is not None else object()] = row
+    return list(by_url.values())
+
+def insert_posts(items, track_high_water_marks=True, batch_size=INSERT_BATCH_SIZE):
+    """Insert Apify dataset items in bounded batches and return the ids of new rows.
+
+    `items` may be any iterable, including a lazy dataset iterator; at most
+    `batch_size` rows are held in memory at a time. Posts whose url is already
+    stored get their caption and signed media urls refreshed but are not
+    reported as new.
+    """
+    new_ids = []
+    for batch in stream_insert_posts(items, track_high_water_marks, batch_size):
+        new_ids.extend(row["id"] for row in batch)
+    return new_ids
+
+def stream_insert_posts(items, track_high_water_marks=True, batch_size=INSERT_BATCH_SIZE):
+    """Like insert_posts, but commit each batch and yield its new rows as dicts.
+
+    Lets callers start work on the first posts while later ones are still arriving.
+    """
+    # CDN media urls are signed and expire, so a rescraped post keeps the fresh ones;
+    # xmax is 0 only on rows this statement inserted
+    insert_query = (
+        f"INSERT INTO instagram_data ({', '.join(INSERT_COLUMNS)}) VALUES %s"
+        " ON CONFLICT (url) DO UPDATE SET caption = EXCLUDED.caption,"
+        " video_url = EXCLUDED.video_url, display_url = EXCLUDED.display_url"
+        " RETURNING id, username, timestamp, video_url, display_url, (xmax = 0) AS inserted"
+    )
+
+    usernames = set()
+    items = iter(items)
+    while True:
+        batch = _dedupe_by_url(_item_row(item) for item in islice(items, batch_size))
+        if not batch:
+            break
+        with db_connection() as conn:
+            with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                rows = execute_values(cur, insert_query, batch, page_size=batch_size, fetch=True)
+        rows = [row for row in rows if row.pop("inserted")]
+        for row in rows:
+            if row["username"]:
+                usernames.add(row["username"].lower())
+        yield rows
+    if track_high_water_marks and usernames:
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                _update_high_water_marks(cur, usernames)
+
+def _update_high_water_marks(cur, usernames):
+    for username in usernames:
+        cur.execute("""
+        INSERT INTO scrape_state (username, last_timestamp, last_url, updated_at)
+        SELECT %s, timestamp, url, now() FROM instagram_data
+        WHERE lower(username) = %s AND timestamp IS NOT NULL
+        ORDER BY timestamp DESC LIMIT 1
+        ON CONFLICT (username) DO UPDATE
+        SET last_timestamp = EXCLUDED.last_timestamp, last_url = EXCLUDED.last_url, updated_at = now()
+        """, (username, username))
+
+def get_high_water_mark(username):
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT last_timestamp, last_url FROM scrape_state WHERE username = %s",
+                (username.lstrip("@").lower(),),
+            )
+            return cur.fetchone()
+
+def fetch_user_posts(username, limit=None, since=None, ids=None):
+    """A user's posts, newest first, as dicts keyed by column name.
+
+    Served by the (lower(username), timestamp) index rather than a table scan.
+    """
+    query = "SELECT id, username, caption, url, timestamp, video_url, display_url FROM instagram_data WHERE lower(username) = lower(%s)"
+    params = [username.lstrip("@")]
+    if since is not None:
+        query += " AND timestamp > %s"
+        params.append(since)
+    if ids is not None:
+        query += " AND id = ANY(%s)"
+        params.append(list(ids))
+    query += " ORDER BY timestamp DESC NULLS LAST"
+    if limit is not None:
+        query += " LIMIT %s"
+        params.append(limit)
+    with db_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import uuid
+import logging
+import functools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+import tracing
+
+# Load environment variables
+load_dotenv('.env.development.local')
+
+# Job queue setup
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "/tmp/buildspace_jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# A job whose owner has not renewed its lease for this many seconds is treated as orphaned
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", str(JOB_LEASE_SECONDS / 3)))
+
+# Job and stage states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+def _initial_stages(stage_names):
+    return {name: {"status": QUEUED, "started_at": None, "finished_at": None, "error": None}
+            for name in stage_names}
+
+class JobStore:
+    """SQLite-backed record of every digest job and the status of each of its stages."""
+
+    def __init__(self, path=JOBS_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                username TEXT,
+                status TEXT,
+                stages TEXT,
+                summary TEXT,
+                error TEXT,
+                created_at TEXT,
+                updated_at TEXT
+            )
+            """)
+            # Job tables created by earlier versions lack the newer columns
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(jobs)")]
+            for column, column_type in (("report", "TEXT"), ("owner", "TEXT"), ("heartbeat_at", "REAL")):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def create(self, username, stage_names, owner=None):
+        job_id = uuid.uuid4().hex
+        stages = _initial_stages(stage_names)
+        now = _now()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, username, status, stages, created_at, updated_at, owner, heartbeat_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, username, QUEUED, json.dumps(stages), now, now, owner, time.time()),
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["stages"] = json.loads(job["stages"])
+        job["report"] = json.loads(job["report"]) if job["report"] else None
+        return job
+
+    def pending(self, lease=JOB_LEASE_SECONDS, exclude_owner=None):
+        """Unfinished jobs whose owner stopped renewing its lease, oldest first."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) AND (heartbeat_at IS NULL OR heartbeat_at < ?)"
+                " AND (owner IS NULL OR owner != ?) ORDER BY created_at",
+                (QUEUED, RUNNING, time.time() - lease, exclude_owner or ""),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def claim(self, job_id, owner, lease=JOB_LEASE_SECONDS):
+        """Take over an unfinished job unless another live owner holds its lease; True if `owner` now has it."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET owner = ?, heartbeat_at = ? WHERE id = ? AND status IN (?, ?)"
+                " AND (owner IS NULL OR owner = ? OR heartbeat_at IS NULL OR heartbeat_at < ?)",
+                (owner, now, job_id, QUEUED, RUNNING, owner, now - lease),
+            )
+            return cursor.rowcount == 1
+
+    def heartbeat(self, owner):
+        """Renew the lease on every unfinished job held by `owner`."""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status IN (?, ?)",
+                (time.time(), owner, QUEUED, RUNNING),
+            )
+
+    def update_stage(self, job_id, stage, status, error=None):
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            stages = json.loads(row[0])
+            entry = stages[stage]
+            entry["status"] = status
+            if status == RUNNING:
+                entry["started_at"] = _now()
+            else:
+                entry["finished_at"] = _now()
+            entry["error"] = error
+            conn.execute(
+                "UPDATE jobs SET status = ?, stages = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, json.dumps(stages), _now(), job_id),
+            )
+
+    def update_progress(self, job_id, stage, progress):
+        """Record item counts for a stage that is still running."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            stages = json.loads(row[0])
+            stages[stage]["progress"] = progress
+            conn.execute("UPDATE jobs SET stages = ?, updated_at = ? WHERE id = ?", (json.dumps(stages), _now(), job_id))
+
+    def reset_stages(self, job_id, stage_names):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET stages = ?, updated_at = ? WHERE id = ?",
+                (json.dumps(_initial_stages(stage_names)), _now(), job_id),
+            )
+
+    def update_summary(self, job_id, summary):
+        """Store the summary written so far, for clients following the job while it runs."""
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE jobs SET summary = ?, updated_at = ? WHERE id = ?", (summary, _now(), job_id))
+
+    def finish(self, job_id, status, summary=None, error=None, report=None):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, summary = ?, error = ?, report = ?, updated_at = ? WHERE id = ?",
+                (status, summary, error, json.dumps(report) if report else None, _now(), job_id),
+            )
+
+class JobQueue:
+    """Runs digest jobs on a background worker pool, one stage at a time.
+
+    `stages` is an ordered list of (name, callable) pairs. Each callable receives a
+    context dict holding the job's `username` and anything earlier stages put there;
+    the final `summary` key becomes the job's result. Stages that write the summary
+    gradually can pass each partial text to the context's `on_partial` callback, and
+    long stages can report item counts through `on_progress`.
+    """
+
+    def __init__(self, stages, store=None, workers=JOB_WORKERS, lease=JOB_LEASE_SECONDS,
+                 heartbeat_interval=JOB_HEARTBEAT_INTERVAL):
+        self.stages = stages
+        self.store = store or JobStore()
+        self.lease = lease
+        self.heartbeat_interval = heartbeat_interval
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="digest-job")
+        # Written to every job this process runs, so other processes leave them alone
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start renewing this process's job leases and taking over orphaned jobs.
+
+        Meant to be called from the serving process's startup, not at import; safe to call repeatedly.
+        Does nothing in multiprocessing children, which re-import the parent's main module.
+        """
+        # Named by multiprocessing before the child imports the main module, unlike parent_process()
+        if multiprocessing.current_process().name != "MainProcess":
+            logger.warning("Not starting the job queue inside a child process")
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            self._started = True
+        threading.Thread(target=self._heartbeat, name="digest-job-heartbeat", daemon=True).start()
+        self.resume_pending()
+
+    def submit(self, username):
+        self.start()
+        job_id = self.store.create(username, [name for name, _ in self.stages], owner=self.owner)
+        self.executor.submit(self._run, job_id, username)
+        logger.info(f"Enqueued job {job_id} for username: {username}")
+        return job_id
+
+    def resume_pending(self):
+        """Re-enqueue jobs whose owner died while they were queued or half-run."""
+        # Our own jobs are never orphans, even if a slow heartbeat let their lease lapse
+        for job_id in self.store.pending(self.lease, exclude_owner=self.owner):
+            if not self.store.claim(job_id, self.owner, self.lease):
+                continue
+            job = self.store.get(job_id)
+            self.executor.submit(self._run, job_id, job["username"])
+            logger.info(f"Resumed job {job_id} for username: {job['username']}")
+
+    def _heartbeat(self):
+        # A process started right after a crash sees the dead owner's lease still fresh,
+        # so orphans are looked for on every tick, not only at start
+        while not self._stopped.wait(self.heartbeat_interval):
+            try:
+                self.store.heartbeat(self.owner)
+            except Exception as e:
+                logger.error(f"Failed to renew job leases: {str(e)}")
+            try:
+                self.resume_pending()
+            except Exception as e:
+                logger.error(f"Failed to resume orphaned jobs: {str(e)}")
+
+    def _run(self, job_id, username):
+        if not self.store.claim(job_id, self.owner, self.lease):
+            logger.info(f"Job {job_id} is held by another process, skipping")
+            return
+        stage_names = [name for name, _ in self.stages]
+        stored_names = list(self.store.get(job_id)["stages"])
+        if stored_names != stage_names:
+            # Created under the other stage layout (before a deploy, or with STREAMING_PIPELINE
+            # toggled); every stage reruns on resume anyway, so start over under the current one
+            logger.warning(f"Job {job_id} was created with stages {stored_names}, rerunning as {stage_names}")
+            self.store.reset_stages(job_id, stage_names)
+        context = {
+            "job_id": job_id,
+            "username": username,
+            "on_partial": lambda summary: self.store.update_summary(job_id, summary),
+        }
+        error = None
+        with tracing.run(job_id) as trace:
+            for index, (name, stage) in enumerate(self.stages):
+                context["on_progress"] = functools.partial(self.store.update_progress, job_id, name)
+                try:
+                    self.store.update_stage(job_id, name, RUNNING)
+                    with tracing.span(name):
+                        stage(context)
+                except Exception as e:
+                    error = str(e)
+                    logger.error(f"Job {job_id} failed in stage '{name}': {error}")
+                    self.store.update_stage(job_id, name, FAILED, error=error)
+                    for skipped, _ in self.stages[index + 1:]:
+                        self.store.update_stage(job_id, skipped, SKIPPED)
+                    break
+                self.store.update_stage(job_id, name, SUCCEEDED)
+        if error is not None:
+            self.store.finish(job_id, FAILED, error=error, report=trace.report())
+            return
+        self.store.finish(job_id, SUCCEEDED, summary=context.get("summary"), report=trace.report())
+        logger.info(f"Job {job_id} for username {username} completed")
+
+    def shutdown(self, wait=True):
+        self._stopped.set()
+        self.executor.shutdown(wait=wait)
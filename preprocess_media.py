@@ -0,0 +1,225 @@
+import os
+import io
+import atexit
+import hashlib
+import shutil
+import threading
+import tempfile
+import subprocess
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from storage_backend import get_storage
+import tracing
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it images pass through untouched
+    Image = None
+
+# Load environment variables
+load_dotenv('.env.development.local')
+
+# Preprocessing setup
+PREPROCESS_MEDIA = os.getenv("PREPROCESS_MEDIA", "false").lower() == "true"
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(os.cpu_count() or 2)))
+PREPROCESS_MAX_IMAGE_SIDE = int(os.getenv("PREPROCESS_MAX_IMAGE_SIDE", "768"))
+PREPROCESS_JPEG_QUALITY = int(os.getenv("PREPROCESS_JPEG_QUALITY", "80"))
+PREPROCESS_VIDEO_MODE = os.getenv("PREPROCESS_VIDEO_MODE", "proxy")  # proxy or keyframes
+PREPROCESS_VIDEO_HEIGHT = int(os.getenv("PREPROCESS_VIDEO_HEIGHT", "360"))
+PREPROCESS_VIDEO_FPS = float(os.getenv("PREPROCESS_VIDEO_FPS", "1"))
+PREPROCESS_KEYFRAMES = int(os.getenv("PREPROCESS_KEYFRAMES", "9"))
+PREPROCESS_DEDUPE_DISTANCE = int(os.getenv("PREPROCESS_DEDUPE_DISTANCE", "5"))  # bits of a 64-bit dHash
+
+PREPROCESSED_PREFIX = "instagram_preprocessed/"
+FFMPEG = shutil.which("ffmpeg")
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def dhash(image, size=8):
+    """64-bit difference hash: near-identical frames differ in only a few bits."""
+    pixels = list(image.convert("L").resize((size + 1, size)).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return bits
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+def _encode_jpeg(image):
+    output = io.BytesIO()
+    image.convert("RGB").save(output, format="JPEG", quality=PREPROCESS_JPEG_QUALITY, optimize=True)
+    return output.getvalue()
+
+def shrink_image(data):
+    image = Image.open(io.BytesIO(data))
+    image.thumbnail((PREPROCESS_MAX_IMAGE_SIDE, PREPROCESS_MAX_IMAGE_SIDE))
+    return _encode_jpeg(image)
+
+def _run_ffmpeg(args):
+    subprocess.run([FFMPEG, "-y", "-loglevel", "error", *args], check=True, capture_output=True)
+
+def video_proxy(source_path, workdir):
+    """Low-resolution, low-frame-rate, low-bitrate copy that keeps a mono audio track."""
+    output_path = os.path.join(workdir, "proxy.mp4")
+    _run_ffmpeg([
+        "-i", source_path,
+        "-vf", f"fps={PREPROCESS_VIDEO_FPS},scale=-2:'min(ih,{PREPROCESS_VIDEO_HEIGHT})'",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "32",
+        "-c:a", "aac", "-ac", "1", "-b:a", "32k",
+        "-movflags", "+faststart",
+        output_path,
+    ])
+    with open(output_path, "rb") as f:
+        return f.read()
+
+def video_keyframes(source_path, workdir):
+    """Sample frames evenly, drop near-duplicates and tile the rest into one contact sheet."""
+    _run_ffmpeg([
+        "-i", source_path,
+        "-vf", f"fps={PREPROCESS_VIDEO_FPS},scale=-2:{PREPROCESS_VIDEO_HEIGHT}",
+        os.path.join(workdir, "frame_%04d.jpg"),
+    ])
+    paths = sorted(name for name in os.listdir(workdir) if name.startswith("frame_"))
+    if not paths:
+        raise ValueError("ffmpeg produced no frames")
+    step = max(1, len(paths) // PREPROCESS_KEYFRAMES)
+    frames, hashes = [], []
+    for name in paths[::step]:
+        frame = Image.open(os.path.join(workdir, name))
+        frame_hash = dhash(frame)
+        if any(hamming(frame_hash, seen) <= PREPROCESS_DEDUPE_DISTANCE for seen in hashes):
+            continue
+        frames.append(frame)
+        hashes.append(frame_hash)
+    frames = frames[:PREPROCESS_KEYFRAMES]
+
+    columns = min(3, len(frames))
+    rows = -(-len(frames) // columns)
+    width, height = frames[0].size
+    sheet = Image.new("RGB", (columns * width, rows * height))
+    for index, frame in enumerate(frames):
+        sheet.paste(frame, ((index % columns) * width, (index // columns) * height))
+    return _encode_jpeg(sheet)
+
+def settings_hash():
+    """Short hash of every setting that shapes an artifact, so changing one stops stale artifacts being reused."""
+    settings = (PREPROCESS_MAX_IMAGE_SIDE, PREPROCESS_JPEG_QUALITY, PREPROCESS_VIDEO_MODE, PREPROCESS_VIDEO_HEIGHT,
+                PREPROCESS_VIDEO_FPS, PREPROCESS_KEYFRAMES, PREPROCESS_DEDUPE_DISTANCE)
+    return hashlib.sha256(repr(settings).encode("utf-8")).hexdigest()[:8]
+
+def artifact_name_for(blob_name):
+    base = os.path.splitext(os.path.basename(blob_name))[0]
+    is_video = blob_name.endswith(".mp4")
+    extension = ".mp4" if is_video and PREPROCESS_VIDEO_MODE == "proxy" else ".jpg"
+    return f"{PREPROCESSED_PREFIX}{base}-{settings_hash()}{extension}"
+
+def preprocess_one(blob_name):
+    """Worker: write the slimmed artifact for `blob_name` and return its name.
+
+    Runs in a child process. Returns the original blob name when the media can't be
+    shrunk here (missing Pillow or ffmpeg), so extraction still sees every post.
+    """
+    storage = get_storage()
+    artifact_name = artifact_name_for(blob_name)
+    is_video = blob_name.endswith(".mp4")
+    if Image is None or (is_video and not FFMPEG):
+        return blob_name
+
+    # Artifacts are derived deterministically from the blob and the settings in their name,
+    # so one from an earlier run can be reused
+    if storage.stat(artifact_name) is not None:
+        return artifact_name
+
+    data = storage.read_bytes(blob_name)
+    if not is_video:
+        output = shrink_image(data)
+        content_type = "image/jpeg"
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            source_path = os.path.join(workdir, "source.mp4")
+            with open(source_path, "wb") as f:
+                f.write(data)
+            if PREPROCESS_VIDEO_MODE == "keyframes":
+                output = video_keyframes(source_path, workdir)
+                content_type = "image/jpeg"
+            else:
+                output = video_proxy(source_path, workdir)
+                content_type = "video/mp4"
+    if len(output) >= len(data):
+        # Re-encoding made it bigger, so send the original instead
+        return blob_name
+
+    writer = storage.open_writer(artifact_name, content_type)
+    writer.write(output)
+    writer.close()
+    logger.info(f"Preprocessed {blob_name} -> {artifact_name} ({len(data)} -> {len(output)} bytes)")
+    return artifact_name
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def create_preprocess_pool(workers=PREPROCESS_WORKERS):
+    """A process pool for preprocess_one.
+
+    spawn avoids forking while other threads hold client locks, but each child
+    re-imports the parent's `__main__` module. Entry points must therefore not
+    start work at import time; app.py starts its job queue on the first request,
+    and JobQueue.start refuses to run inside a child process.
+    """
+    context = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+
+def get_preprocess_pool():
+    """The process-wide pool of PREPROCESS_WORKERS children, shared by every job.
+
+    Replaced with a fresh pool if a child died and broke the previous one.
+    """
+    global _pool
+    with _pool_lock:
+        # ProcessPoolExecutor has no public way to ask whether it is broken
+        if _pool is None or getattr(_pool, "_broken", False):
+            _pool = create_preprocess_pool()
+        return _pool
+
+def shutdown_preprocess_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+
+atexit.register(shutdown_preprocess_pool)
+
+def preprocess_media(blob_names):
+    """Shrink media for extraction in a process pool.
+
+    Returns the artifact names to extract from, one per post and in the same order
+    as `blob_names`; any item that fails to preprocess falls back to its original
+    blob. Near-duplicate filtering only applies to frames within one video, since
+    similar-looking posts (quote cards, recurring templates) still differ in content.
+    """
+    if not blob_names:
+        return []
+    if Image is None:
+        logger.warning("Pillow is not installed, skipping media preprocessing")
+        return list(blob_names)
+
+    executor = get_preprocess_pool()
+    futures = [executor.submit(preprocess_one, blob_name) for blob_name in blob_names]
+    artifacts = []
+    for blob_name, future in zip(blob_names, futures):
+        try:
+            artifacts.append(future.result())
+        except Exception as e:
+            logger.error(f"Preprocessing failed for {blob_name}, using the original: {str(e)}")
+            tracing.increment("preprocess.failed")
+            artifacts.append(blob_name)
+    return artifacts
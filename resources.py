@@ -0,0 +1,163 @@
+import os
+import atexit
+import threading
+import logging
+import contextlib
+import requests
+from requests.adapters import HTTPAdapter
+from psycopg2 import pool as pg_pool
+from google.cloud import storage
+from google.oauth2 import service_account
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv('.env.development.local')
+
+# Database connection setup
+DATABASE_URL = os.getenv("POSTGRES_URL")
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+
+# Google Cloud Storage setup
+GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
+GCS_CREDENTIALS_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+
+# Vertex AI setup
+VERTEX_PROJECT_ID = os.getenv("VERTEX_PROJECT_ID", "profound-vista-384310")
+VERTEX_LOCATION = os.getenv("VERTEX_LOCATION", "us-central1")
+MODEL_NAME = os.getenv("MODEL_NAME", "gemini-1.5-pro-001")
+
+# HTTP session setup: when unset, the pool is sized by the callers that own the worker counts
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "0"))
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_gcs_client = None
+_bucket = None
+_db_pool = None
+# ThreadedConnectionPool raises PoolError when exhausted instead of waiting, so borrowers queue here first
+_db_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+_http_session = None
+_http_pool_size = 0
+_model = None
+
+def get_gcs_client():
+    global _gcs_client
+    with _lock:
+        if _gcs_client is None:
+            credentials = service_account.Credentials.from_service_account_file(
+                GCS_CREDENTIALS_PATH, scopes=["https://www.googleapis.com/auth/cloud-platform"]
+            )
+            _gcs_client = storage.Client(credentials=credentials)
+            logger.info("Initialized shared GCS client")
+        return _gcs_client
+
+def get_bucket():
+    global _bucket
+    with _lock:
+        if _bucket is None:
+            _bucket = get_gcs_client().bucket(GCS_BUCKET_NAME)
+        return _bucket
+
+def get_db_pool():
+    global _db_pool
+    with _lock:
+        if _db_pool is None:
+            _db_pool = pg_pool.ThreadedConnectionPool(DB_POOL_MIN, DB_POOL_MAX, DATABASE_URL, sslmode='require')
+            logger.info(f"Initialized Postgres connection pool ({DB_POOL_MIN}-{DB_POOL_MAX} connections)")
+        return _db_pool
+
+@contextlib.contextmanager
+def db_connection():
+    """Borrow a pooled connection, committing on success and rolling back on error.
+
+    Blocks while all DB_POOL_MAX connections are lent out.
+    """
+    db_pool = get_db_pool()
+    with _db_slots:
+        conn = db_pool.getconn()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            # Connections dropped by the server are discarded rather than handed out again
+            db_pool.putconn(conn, close=bool(conn.closed))
+
+def get_http_session(pool_size=1):
+    """Return the shared session, keeping at least `pool_size` connections per host.
+
+    Every caller passes the number of threads it will use the session from; the pool
+    only grows, so it ends up sized for the largest caller. HTTP_POOL_SIZE overrides it.
+    """
+    global _http_session, _http_pool_size
+    with _lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+        pool_size = HTTP_POOL_SIZE or pool_size
+        # Sessions swapped in from outside (benchmark fakes) are left as they are
+        if isinstance(_http_session, requests.Session) and pool_size > _http_pool_size:
+            # Requests in flight keep the old adapter's connections until they finish
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _http_session.mount("https://", adapter)
+            _http_session.mount("http://", adapter)
+            _http_pool_size = pool_size
+        return _http_session
+
+def get_model():
+    global _model
+    with _lock:
+        if _model is None:
+            import vertexai
+            from vertexai.generative_models import GenerativeModel
+
+            vertexai.init(project=VERTEX_PROJECT_ID, location=VERTEX_LOCATION)
+            _model = GenerativeModel(MODEL_NAME)
+            logger.info(f"Initialized Vertex AI model {MODEL_NAME}")
+        return _model
+
+def health_check():
+    """Probe every shared resource and report `ok` or the error for each."""
+    checks = {
+        "database": _check_database,
+        "storage": _check_storage,
+        "model": lambda: get_model() is not None,
+    }
+    status = {}
+    for name, check in checks.items():
+        try:
+            status[name] = "ok" if check() else "unavailable"
+        except Exception as e:
+            status[name] = f"error: {str(e)}"
+    return status
+
+def _check_database():
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+            return cur.fetchone() == (1,)
+
+def _check_storage():
+    from storage_backend import get_storage
+
+    return get_storage().exists()
+
+def shutdown():
+    """Close pooled connections and drop every cached handle."""
+    global _gcs_client, _bucket, _db_pool, _http_session, _http_pool_size, _model
+    with _lock:
+        if _db_pool is not None:
+            _db_pool.closeall()
+        if _http_session is not None:
+            _http_session.close()
+        if _gcs_client is not None:
+            _gcs_client.close()
+        _gcs_client = _bucket = _db_pool = _http_session = _model = None
+        _http_pool_size = 0
+
+atexit.register(shutdown)
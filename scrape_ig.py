@@ -1,38 +1,23 @@
 import os
-import psycopg2
+import time
 from apify_client import ApifyClient
 from dotenv import load_dotenv
+from resources import db_connection
+import tracing
+from instagram_store import migrate_schema, truncate_posts, insert_posts, get_high_water_mark
 
 # Load environment variables from .env.development.local
 load_dotenv('.env.development.local')
 
-# Database connection setup
-DATABASE_URL = os.getenv("POSTGRES_URL")
-
-def get_db_connection():
-    return psycopg2.connect(DATABASE_URL, sslmode='require')
+# Incremental mode keeps earlier posts and only fetches what is newer than the last run
+INCREMENTAL_SCRAPING = os.getenv("INCREMENTAL_SCRAPING", "true").lower() == "true"
+# Seconds between dataset polls while streaming items from a running actor
+SCRAPE_POLL_INTERVAL = float(os.getenv("SCRAPE_POLL_INTERVAL", "2"))
 
 def ensure_table_exists_and_empty():
-    create_table_query = """
-    CREATE TABLE IF NOT EXISTS instagram_data (
-        id SERIAL PRIMARY KEY,
-        username TEXT,
-        caption TEXT,
-        url TEXT,
-        timestamp TIMESTAMP,
-        video_url TEXT,
-        display_url TEXT
-    )
-    """
-    truncate_table_query = "TRUNCATE TABLE instagram_data"
-    
-    with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            # Create table if it doesn't exist
-            cur.execute(create_table_query)
-            # Truncate (empty) the table
-            cur.execute(truncate_table_query)
-            conn.commit()
+    migrate_schema()
+    # Truncate (empty) the table
+    truncate_posts()
     print("Table 'instagram_data' has been created (if not exists) and emptied.")
 
 # Get the API token from the environment variable
@@ -47,41 +32,68 @@ run_input = {
     "resultsLimit": 7,
 }
 
+def build_actor_input(username, incremental=INCREMENTAL_SCRAPING):
+    # Copy the input so concurrent jobs don't overwrite each other's username
+    actor_input = dict(run_input, username=[username])
+    if incremental:
+        migrate_schema()
+        high_water_mark = get_high_water_mark(username)
+        if high_water_mark and high_water_mark[0]:
+            actor_input["onlyPostsNewerThan"] = high_water_mark[0].isoformat()
+            print(f"Fetching posts newer than {high_water_mark[0]} for username: {username}")
+    return actor_input
+
 # Function to run the Instagram scraper
-def run_instagram_scraper(username):
-    run_input['username'] = [username]
+def run_instagram_scraper(username, apify_client=None, incremental=INCREMENTAL_SCRAPING):
+    apify_client = apify_client or client
+    actor_input = build_actor_input(username, incremental)
     print(f"Running Instagram scraper for username: {username}")
-    run = client.actor("apify/instagram-post-scraper").call(run_input=run_input)
+    run = apify_client.actor("apify/instagram-post-scraper").call(run_input=actor_input)
     print("Instagram scraper run completed.")
     return run
 
-# Function to save scraped data to JSON file
-def save_scraped_data(run, skip_table_check=False):
+# Function to yield pages of scraped items while the actor is still running
+def stream_scraped_pages(username, apify_client=None, incremental=INCREMENTAL_SCRAPING, poll_interval=SCRAPE_POLL_INTERVAL):
+    apify_client = apify_client or client
+    actor_input = build_actor_input(username, incremental)
+    print(f"Starting Instagram scraper for username: {username}")
+    run = apify_client.actor("apify/instagram-post-scraper").start(run_input=actor_input)
+    dataset = apify_client.dataset(run["defaultDatasetId"])
+    offset = 0
+    while True:
+        # Read the status before the items so nothing pushed just before finishing is missed
+        status = apify_client.run(run["id"]).get()["status"]
+        items = dataset.list_items(offset=offset).items
+        offset += len(items)
+        if items:
+            yield items
+        if status in ("SUCCEEDED", "FAILED", "TIMED-OUT", "ABORTED"):
+            break
+        time.sleep(poll_interval)
+    if status != "SUCCEEDED":
+        raise RuntimeError(f"Instagram scraper run {run['id']} finished with status {status}")
+    print("Instagram scraper run completed.")
+
+# Function to save scraped data to the database, returning the ids of newly stored posts
+def save_scraped_data(run, skip_table_check=False, apify_client=None, incremental=INCREMENTAL_SCRAPING):
+    apify_client = apify_client or client
     if not skip_table_check:
-        ensure_table_exists_and_empty()
-    insert_query = """
-    INSERT INTO instagram_data (username, caption, url, timestamp, video_url, display_url)
-    VALUES (%s, %s, %s, %s, %s, %s)
-    """
-    with get_db_connection() as conn:
-        with conn.cursor() as cur:
-            for item in client.dataset(run["defaultDatasetId"]).iterate_items():
-                cur.execute(insert_query, (
-                    item.get("ownerUsername"),
-                    item.get("caption"),
-                    item.get("url"),
-                    item.get("timestamp"),
-                    item.get("videoUrl"),
-                    item.get("displayUrl")
-                ))
-            conn.commit()
-    print("Data has been saved to the database")
+        if incremental:
+            migrate_schema()
+        else:
+            ensure_table_exists_and_empty()
+    # Dataset items are streamed straight into batched multi-row inserts
+    items = apify_client.dataset(run["defaultDatasetId"]).iterate_items()
+    new_ids = insert_posts(items, track_high_water_marks=incremental)
+    print(f"Data has been saved to the database ({len(new_ids)} new posts)")
+    tracing.increment("save.new_posts", len(new_ids))
+    return new_ids
 
 if __name__ == "__main__":
     # Test database connection
     def test_db_connection():
         try:
-            with get_db_connection() as conn:
+            with db_connection() as conn:
                 with conn.cursor() as cur:
                     cur.execute('SELECT 1')
             print("Database connection successful!")
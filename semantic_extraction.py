@@ -1,58 +1,181 @@
 import os
-from google.cloud import storage
-from google.oauth2 import service_account
-from dotenv import load_dotenv
-import vertexai
-from vertexai.generative_models import GenerativeModel, Part
 import time
-from google.api_core import retry
-from google.api_core import exceptions as google_exceptions
+import hashlib
+from dotenv import load_dotenv
+from vertexai.generative_models import Part
+from resources import get_model, MODEL_NAME
+from storage_backend import get_storage
+from extraction_scheduler import run_scheduled, AdaptiveScheduler
+from extraction_cache import get_cache, cache_key
+import tracing
 
 # Load environment variables
 load_dotenv('.env.development.local')
 
-# Project and bucket setup
-project_id = "profound-vista-384310"
-GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")  # This should be "ig2newsletter"
-GCS_CREDENTIALS_PATH = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-
-# Initialize Vertex AI
-vertexai.init(project=project_id, location="us-central1")
+# Send media bytes inline instead of a storage URI (always the case for local storage)
+EXTRACTION_INLINE_MEDIA = os.getenv("EXTRACTION_INLINE_MEDIA", "false").lower() == "true"
 
-# Initialize the model
-model = GenerativeModel("gemini-1.5-pro-001")
+# Summarise each post briefly (map), then write one newsletter from the summaries (reduce)
+MAP_REDUCE_DIGEST = os.getenv("MAP_REDUCE_DIGEST", "true").lower() == "true"
 
-def get_gcs_client():
-    credentials = service_account.Credentials.from_service_account_file(
-        GCS_CREDENTIALS_PATH, scopes=["https://www.googleapis.com/auth/cloud-platform"]
-    )
-    return storage.Client(credentials=credentials)
-
-@retry.Retry(predicate=retry.if_exception_type(google_exceptions.ServiceUnavailable))
-def process_content_with_retry(blob_name: str, prompt: str):
-    file_uri = f"gs://{GCS_BUCKET_NAME}/{blob_name}"
+def media_part(blob_name: str):
     mime_type = "video/mp4" if blob_name.endswith('.mp4') else "image/jpeg"
-    
-    file_part = Part.from_uri(file_uri, mime_type=mime_type)
+    storage = get_storage()
+    if storage.supports_uri and not EXTRACTION_INLINE_MEDIA:
+        return Part.from_uri(storage.uri(blob_name), mime_type=mime_type)
+    data = storage.read_bytes(blob_name)
+    item_span = tracing.current_span()
+    if item_span is not None:
+        item_span.bytes += len(data)
+    return Part.from_data(data, mime_type=mime_type)
+
+def process_content(blob_name: str, prompt: str, model=None):
+    file_part = media_part(blob_name)
     contents = [file_part, prompt]
 
-    response = model.generate_content(contents)
+    response = (model or get_model()).generate_content(contents)
     return response.text
 
-def process_instagram_data(prompt: str):
-    storage_client = get_gcs_client()
-    bucket = storage_client.bucket(GCS_BUCKET_NAME)
-    
-    all_texts = []
-    for blob in bucket.list_blobs(prefix="instagram_content/"):
+def list_content_blobs(blob_names=None):
+    storage = get_storage()
+    if blob_names is None:
+        return storage.list("instagram_content/")
+    blobs = []
+    for blob_name in blob_names:
+        blob = storage.stat(blob_name)
+        if blob is None:
+            print(f"Skipping {blob_name}: not found in {storage.name} storage")
+            continue
+        blobs.append(blob)
+    return blobs
+
+def create_scheduler(prompt: str, model=None):
+    """A shared scheduler for extracting items one at a time from several threads."""
+    return AdaptiveScheduler(lambda blob_name: process_content(blob_name, prompt, model), span_name="extract.item")
+
+def extract_one(blob_name: str, prompt: str, scheduler, cache=None):
+    """Summarise one stored blob through `scheduler`, serving it from the cache when possible."""
+    stored = get_storage().stat(blob_name)
+    if stored is None:
+        raise FileNotFoundError(f"{blob_name} not found in {get_storage().name} storage")
+    key = cache_key(stored.content_hash, prompt, MODEL_NAME) if cache and stored.content_hash else None
+    if key:
+        cached = cache.get(key)
+        if cached is not None:
+            tracing.increment("extract.cache_hits")
+            return cached
+        tracing.increment("extract.cache_misses")
+    outcome = scheduler.call(blob_name)
+    if isinstance(outcome, Exception):
+        raise outcome
+    if key:
+        cache.set(key, outcome)
+    return outcome
+
+def extraction_prompt(prompt: str):
+    """The prompt each post is extracted with: a short summary in map-reduce mode, else `prompt` itself."""
+    return post_summary_prompt if MAP_REDUCE_DIGEST else prompt
+
+def _numbered(summaries):
+    return "\n\n".join(f"Post {index}:\n{summary}" for index, summary in enumerate(summaries, 1))
+
+def stream_digest(summaries, prompt: str, model=None):
+    """Yield the newsletter text chunk by chunk as the model writes it from per-post summaries."""
+    contents = [reduce_preamble + prompt, _numbered(summaries)]
+    for chunk in (model or get_model()).generate_content(contents, stream=True):
         try:
-            text = process_content_with_retry(blob.name, prompt)
-            all_texts.append(text)
-        except Exception as e:
-            print(f"Error processing {blob.name}: {str(e)}")
-        time.sleep(1)  # Add a small delay between requests
-    
-    return "\n\n".join(all_texts)
+            text = chunk.text
+        except ValueError:
+            # Chunks without text parts, such as the final one carrying only the finish reason
+            continue
+        if text:
+            yield text
+
+def build_digest(texts, prompt: str, model=None, on_partial=None, cache=None):
+    """Turn the per-post extraction outputs into the final digest.
+
+    In map-reduce mode `texts` are short summaries and one streamed model call
+    writes the newsletter; `on_partial(text_so_far)` is called as each chunk
+    arrives. Throttled reduce calls are retried from the start, so the partial
+    text can shrink back to empty. The newsletter is cached under the ordered
+    summaries and prompt, so an unchanged profile is answered without a call.
+    Otherwise the outputs are joined as they are.
+    """
+    if not MAP_REDUCE_DIGEST:
+        return "\n\n".join(texts)
+    if not texts:
+        return ""
+    key = None
+    if cache:
+        summaries_hash = hashlib.sha256(_numbered(texts).encode("utf-8")).hexdigest()
+        key = cache_key(summaries_hash, reduce_preamble + prompt, MODEL_NAME)
+        cached = cache.get(key)
+        if cached is not None:
+            tracing.increment("reduce.cache_hits")
+            if on_partial:
+                on_partial(cached)
+            return cached
+        tracing.increment("reduce.cache_misses")
+
+    def reduce(_):
+        parts = []
+        started = time.monotonic()
+        for text in stream_digest(texts, prompt, model):
+            if not parts:
+                tracing.current_span().attributes["first_token_seconds"] = round(time.monotonic() - started, 6)
+            parts.append(text)
+            if on_partial:
+                on_partial("".join(parts))
+        return "".join(parts)
+
+    scheduler = AdaptiveScheduler(reduce, max_concurrency=1, initial_concurrency=1, span_name="reduce")
+    outcome = scheduler.call(f"{len(texts)} summaries")
+    if isinstance(outcome, Exception):
+        raise outcome
+    if key:
+        cache.set(key, outcome)
+    return outcome
+
+def process_instagram_data(prompt: str, model=None, blob_names=None, on_partial=None):
+    cache = get_cache()
+    # The cache is keyed by the prompt actually sent with the media
+    digest_prompt, prompt = prompt, extraction_prompt(prompt)
+
+    blobs = list_content_blobs(blob_names)
+
+    blob_names = []
+    cache_keys = {}
+    for blob in blobs:
+        blob_names.append(blob.name)
+        if cache and blob.content_hash:
+            cache_keys[blob.name] = cache_key(blob.content_hash, prompt, MODEL_NAME)
+
+    texts = {}
+    if cache:
+        for blob_name, key in cache_keys.items():
+            cached = cache.get(key)
+            if cached is not None:
+                texts[blob_name] = cached
+        print(f"Extraction cache: {len(texts)} hits, {len(blob_names) - len(texts)} misses")
+        tracing.increment("extract.cache_hits", len(texts))
+        tracing.increment("extract.cache_misses", len(blob_names) - len(texts))
+    misses = [blob_name for blob_name in blob_names if blob_name not in texts]
+
+    # The scheduler owns retries and pacing
+    outcomes = run_scheduled(lambda blob_name: process_content(blob_name, prompt, model), misses, span_name="extract.item")
+
+    for blob_name, outcome in zip(misses, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Error processing {blob_name}: {str(outcome)}")
+            continue
+        texts[blob_name] = outcome
+        if cache and blob_name in cache_keys:
+            cache.set(cache_keys[blob_name], outcome)
+    all_texts = [texts[blob_name] for blob_name in blob_names if blob_name in texts]
+    digest = build_digest(all_texts, digest_prompt, model, on_partial, cache)
+    if cache:
+        cache.evict()
+    return digest
 
 # Prompts for video and image processing
 universal_prompt = """
@@ -96,6 +219,19 @@ Another week gone by, here's a quick recap of what I've been up to:
 [Concluding remarks, call to action, or teaser]
 """
 
+# Map prompt: one short, factual summary per post for the reduce step to work from
+post_summary_prompt = """
+Summarise this Instagram post in 2-4 sentences for the editor of the creator's weekly newsletter.
+- **Videos:** State the core message or topic, the key takeaways and any call to action. Do not describe the visuals for their own sake.
+- **Images:** State the subject, the context and any text or caption shown. Mention if it looks like part of a series.
+Write plain prose in the third person. No headings, greetings or sign-offs.
+"""
+
+# Placed before the newsletter prompt in the reduce call, since the model sees summaries instead of media
+reduce_preamble = """
+The images and videos these instructions refer to have already been summarised, one numbered summary per post. Work from these summaries in place of the media itself and write a single digest covering all of them.
+"""
+
 if __name__ == "__main__":
     result = process_instagram_data(universal_prompt)
     print(result)
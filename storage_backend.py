@@ -0,0 +1,198 @@
+import os
+import mmap
+import base64
+import hashlib
+import threading
+import contextlib
+import logging
+from dataclasses import dataclass
+from typing import Optional
+from google.cloud.storage.retry import DEFAULT_RETRY
+from dotenv import load_dotenv
+from resources import get_bucket
+
+# Load environment variables
+load_dotenv('.env.development.local')
+
+# Storage backend setup
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "gcs")  # gcs or local
+LOCAL_STORAGE_ROOT = os.getenv("LOCAL_STORAGE_ROOT", "/tmp/buildspace_media")
+# Resumable upload chunks must be a multiple of 256 KiB
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(8 * 1024 * 1024)))
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@dataclass
+class StoredObject:
+    name: str
+    size: int
+    md5_hash: Optional[str]  # base64, as GCS reports it; absent on composite objects
+    crc32c: Optional[str] = None  # base64 big-endian, as GCS reports it
+
+    @property
+    def content_hash(self):
+        """Identifies the object's bytes for cache keys, without mixing up the two hash types."""
+        if self.md5_hash:
+            return self.md5_hash
+        return f"crc32c:{self.crc32c}" if self.crc32c else None
+
+class GCSWriter:
+    def __init__(self, blob, content_type):
+        self.blob = blob
+        # Resumable upload: only one UPLOAD_CHUNK_SIZE buffer is held in memory,
+        # and a failed chunk is retried on its own rather than restarting the file
+        self._writer = blob.open("wb", chunk_size=UPLOAD_CHUNK_SIZE, content_type=content_type, retry=DEFAULT_RETRY)
+
+    def write(self, chunk):
+        self._writer.write(chunk)
+
+    def close(self):
+        self._writer.close()
+
+    def abort(self):
+        # Closing finalizes whatever was buffered, so drop the partial object
+        with contextlib.suppress(Exception):
+            self._writer.close()
+            self.blob.delete()
+
+class GCSBackend:
+    """Objects in the configured GCS bucket; the model can read them directly by URI."""
+
+    name = "gcs"
+    supports_uri = True
+
+    def __init__(self, bucket=None):
+        self._bucket = bucket
+
+    @property
+    def bucket(self):
+        return self._bucket or get_bucket()
+
+    def uri(self, name):
+        return f"gs://{self.bucket.name}/{name}"
+
+    def open_writer(self, name, content_type):
+        return GCSWriter(self.bucket.blob(name), content_type)
+
+    def _stored(self, blob):
+        return StoredObject(blob.name, blob.size or 0, blob.md5_hash, blob.crc32c)
+
+    def stat(self, name):
+        blob = self.bucket.get_blob(name)
+        return self._stored(blob) if blob is not None else None
+
+    def list(self, prefix):
+        return [self._stored(blob) for blob in self.bucket.list_blobs(prefix=prefix)]
+
+    def read_bytes(self, name):
+        return self.bucket.blob(name).download_as_bytes()
+
+    def delete(self, name):
+        self.bucket.blob(name).delete()
+
+    def exists(self):
+        return self.bucket.exists()
+
+class LocalWriter:
+    def __init__(self, path):
+        self.path = path
+        self._tmp_path = f"{path}.part"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(self._tmp_path, "wb")
+
+    def write(self, chunk):
+        self._file.write(chunk)
+
+    def close(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._tmp_path)
+
+class LocalBackend:
+    """Objects as files under `root`, read back through memory maps.
+
+    There is no URI the model can fetch, so media is always sent inline.
+    """
+
+    name = "local"
+    supports_uri = False
+
+    def __init__(self, root=LOCAL_STORAGE_ROOT):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, name):
+        root = os.path.abspath(self.root)
+        path = os.path.abspath(os.path.join(root, name))
+        if not path.startswith(root + os.sep):
+            raise ValueError(f"Object name escapes storage root: {name}")
+        return path
+
+    def uri(self, name):
+        return f"file://{self._path(name)}"
+
+    def open_writer(self, name, content_type):
+        return LocalWriter(self._path(name))
+
+    @contextlib.contextmanager
+    def open_mmap(self, name):
+        """Map an object read-only; empty files yield an empty bytes object instead."""
+        with open(self._path(name), "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+    def _stored(self, name):
+        with self.open_mmap(name) as mapped:
+            return StoredObject(name, len(mapped), base64.b64encode(hashlib.md5(mapped).digest()).decode())
+
+    def stat(self, name):
+        if not os.path.isfile(self._path(name)):
+            return None
+        return self._stored(name)
+
+    def list(self, prefix):
+        objects = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in sorted(filenames):
+                if filename.endswith(".part"):
+                    continue
+                name = os.path.relpath(os.path.join(dirpath, filename), self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    objects.append(self._stored(name))
+        return sorted(objects, key=lambda stored: stored.name)
+
+    def read_bytes(self, name):
+        with self.open_mmap(name) as mapped:
+            return bytes(mapped)
+
+    def delete(self, name):
+        os.remove(self._path(name))
+
+    def exists(self):
+        return os.path.isdir(self.root)
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Return the backend selected by STORAGE_BACKEND."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            if STORAGE_BACKEND == "gcs":
+                _storage = GCSBackend()
+            elif STORAGE_BACKEND == "local":
+                _storage = LocalBackend()
+            else:
+                raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+            logger.info(f"Using {STORAGE_BACKEND} storage backend")
+        return _storage
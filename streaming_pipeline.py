@@ -0,0 +1,210 @@
+import os
+import queue
+import threading
+import logging
+from dotenv import load_dotenv
+import tracing
+from scrape_ig import stream_scraped_pages, ensure_table_exists_and_empty, run_input, INCREMENTAL_SCRAPING
+from instagram_store import stream_insert_posts
+from download_content import (
+    download_and_store_content, blob_name_for, fetch_window_posts, shared_host_limiter, DOWNLOAD_WORKERS,
+)
+from preprocess_media import preprocess_one, get_preprocess_pool, PREPROCESS_MEDIA
+from semantic_extraction import create_scheduler, extract_one, extraction_prompt, build_digest
+from extraction_cache import get_cache
+from resources import get_http_session
+from storage_backend import get_storage
+
+# Load environment variables
+load_dotenv('.env.development.local')
+
+# Items allowed to wait between two stages before the upstream stage blocks
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "16"))
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+class StreamingPipeline:
+    """Scrape, store, download and summarise one user's posts with all stages overlapping.
+
+    Posts flow producer -> download workers -> extract workers through bounded
+    queues, so the first summary starts as soon as the first media file lands
+    and a slow stage holds back the ones feeding it instead of buffering
+    without limit. The digest covers the user's latest `window` posts, like
+    the staged pipeline; older posts in that window skip straight to
+    extraction, where the cache usually answers them, unless their media never
+    reached storage, in which case they are downloaded first. In map-reduce mode the
+    newsletter itself is written once the last summary is in.
+
+    `on_progress(counts)` is called whenever a post is saved, downloaded or
+    summarised, or fails to be; a failing item is counted and skipped without
+    stopping the other workers.
+    """
+
+    def __init__(self, username, prompt, model=None, window=None, on_partial=None, on_progress=None,
+                 download_workers=DOWNLOAD_WORKERS, queue_size=STREAM_QUEUE_SIZE):
+        self.username = username
+        self.digest_prompt = prompt
+        self.prompt = extraction_prompt(prompt)
+        self.model = model
+        self.on_partial = on_partial
+        self.on_progress = on_progress
+        self.progress = {"new_posts": 0, "downloaded": 0, "download_failed": 0, "extracted": 0, "extract_failed": 0}
+        self.window = window or run_input["resultsLimit"]
+        self.download_workers = download_workers
+        self.scheduler = create_scheduler(self.prompt, model)
+        self.cache = get_cache()
+        self.download_queue = queue.Queue(maxsize=queue_size)
+        self.extract_queue = queue.Queue(maxsize=queue_size)
+        self.session = get_http_session(download_workers)
+        self.host_limiter = shared_host_limiter
+        # Shared with every other job in the process rather than started per job
+        self.preprocess_pool = get_preprocess_pool() if PREPROCESS_MEDIA else None
+        self.streamed = set()
+        self.texts = {}
+        self._lock = threading.Lock()
+        self._producer_error = None
+
+    def run(self):
+        producer = self._start(self._produce, "stream-scrape")
+        downloaders = [self._start(self._download, f"stream-download-{index}")
+                       for index in range(self.download_workers)]
+        extractors = [self._start(self._extract, f"stream-extract-{index}")
+                      for index in range(self.scheduler.max_concurrency)]
+
+        window_blob_names = []
+        try:
+            producer.join()
+            if self._producer_error is None:
+                window_blob_names = self._enqueue_window()
+        finally:
+            # Release every worker even if listing the window failed, so no thread is left blocked
+            self._stop(downloaders, self.download_queue)
+            self._stop(extractors, self.extract_queue)
+
+        if self._producer_error is not None:
+            raise self._producer_error
+        texts = [self.texts[blob_name] for blob_name in window_blob_names if blob_name in self.texts]
+        digest = build_digest(texts, self.digest_prompt, self.model, self.on_partial, self.cache)
+        if self.cache:
+            self.cache.evict()
+        return digest
+
+    def _start(self, target, name):
+        thread = threading.Thread(target=tracing.bind(target), name=name, daemon=True)
+        thread.start()
+        return thread
+
+    def _stop(self, workers, work_queue):
+        for _ in workers:
+            work_queue.put(_DONE)
+        for worker in workers:
+            worker.join()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.progress[key] += value
+            if not self.on_progress:
+                return
+            try:
+                self.on_progress(dict(self.progress))
+            except Exception as e:
+                # Progress is informational; a failed report must never stop a worker
+                logger.error(f"Failed to report progress for {self.username}: {str(e)}")
+
+    def _enqueue_window(self):
+        """Queue the window's posts that were not streamed and return the window's blob names, newest first.
+
+        Posts from earlier runs are extracted directly unless their media is missing.
+        """
+        storage = get_storage()
+        window_blob_names = []
+        for post in fetch_window_posts(self.username, self.window):
+            blob_name = blob_name_for(post["id"], bool(post["video_url"]))
+            window_blob_names.append(blob_name)
+            with self._lock:
+                if blob_name in self.streamed:
+                    continue
+                self.streamed.add(blob_name)
+            if storage.stat(blob_name) is None:
+                self.download_queue.put(post)
+            else:
+                self.extract_queue.put(blob_name)
+        return window_blob_names
+
+    def _produce(self):
+        try:
+            with tracing.span("scrape"):
+                if not INCREMENTAL_SCRAPING:
+                    ensure_table_exists_and_empty()
+                for page in stream_scraped_pages(self.username):
+                    for rows in stream_insert_posts(page, track_high_water_marks=INCREMENTAL_SCRAPING):
+                        tracing.increment("save.new_posts", len(rows))
+                        self._count("new_posts", len(rows))
+                        for row in rows:
+                            if row["video_url"] or row["display_url"]:
+                                with self._lock:
+                                    self.streamed.add(blob_name_for(row["id"], bool(row["video_url"])))
+                                self.download_queue.put(row)
+        except Exception as e:
+            logger.error(f"Streaming scrape failed for {self.username}: {str(e)}")
+            self._producer_error = e
+
+    def _download(self):
+        # A worker that stopped consuming would let the bounded queue fill and block the producer,
+        # so every item's failure is caught here
+        while True:
+            row = self.download_queue.get()
+            if row is _DONE:
+                return
+            try:
+                blob_name = self._download_one(row)
+                if blob_name is None:
+                    self._count("download_failed")
+                    continue
+                self._count("downloaded")
+                self.extract_queue.put(blob_name)
+            except Exception as e:
+                logger.error(f"Download failed for ID {row['id']}: {str(e)}")
+                self._count("download_failed")
+
+    def _download_one(self, row):
+        is_video = bool(row["video_url"])
+        url = row["video_url"] or row["display_url"]
+        result = download_and_store_content(url, row["id"], is_video, self.session, self.host_limiter)
+        if not result.success:
+            logger.warning(f"Failed to process content for ID {row['id']}")
+            return None
+        return result.blob_name
+
+    def _extract(self):
+        while True:
+            blob_name = self.extract_queue.get()
+            if blob_name is _DONE:
+                return
+            try:
+                text = self._extract_one(blob_name)
+                with self._lock:
+                    self.texts[blob_name] = text
+                self._count("extracted")
+            except Exception as e:
+                logger.error(f"Error processing {blob_name}: {str(e)}")
+                self._count("extract_failed")
+
+    def _extract_one(self, blob_name):
+        target = blob_name
+        if self.preprocess_pool is not None:
+            try:
+                with tracing.span("preprocess.item", item=blob_name):
+                    target = self.preprocess_pool.submit(preprocess_one, blob_name).result()
+            except Exception as e:
+                logger.error(f"Preprocessing failed for {blob_name}, using the original: {str(e)}")
+                tracing.increment("preprocess.failed")
+        return extract_one(target, self.prompt, self.scheduler, self.cache)
+
+def run_streaming_pipeline(username, prompt, model=None, on_partial=None, on_progress=None):
+    """Build the digest for `username` with overlapping stages and return its text."""
+    return StreamingPipeline(username, prompt, model, on_partial=on_partial, on_progress=on_progress).run()
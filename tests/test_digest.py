@@ -0,0 +1,70 @@
+import pytest
+import semantic_extraction
+from benchmarks import fakes
+from extraction_cache import SqliteCache
+from semantic_extraction import build_digest, stream_digest
+
+SUMMARIES = ["First post.", "Second post."]
+
+class Chunk:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("no text parts")
+        return self._text
+
+class ScriptedModel:
+    def __init__(self, *chunks):
+        self.chunks = chunks
+        self.contents = []
+
+    def generate_content(self, contents, stream=False):
+        assert stream
+        self.contents.append(contents)
+        return iter(Chunk(text) for text in self.chunks)
+
+@pytest.fixture(autouse=True)
+def map_reduce(monkeypatch):
+    monkeypatch.setattr(semantic_extraction, "MAP_REDUCE_DIGEST", True)
+
+@pytest.fixture
+def cache(tmp_path):
+    return SqliteCache(str(tmp_path / "cache.sqlite3"), ttl=3600, max_entries=10)
+
+def test_stream_digest_numbers_the_summaries_and_skips_chunks_without_text():
+    model = ScriptedModel("Hey ", None, "there", "")
+    assert list(stream_digest(SUMMARIES, "Write a newsletter.", model)) == ["Hey ", "there"]
+    [[instructions, numbered]] = model.contents
+    assert instructions.endswith("Write a newsletter.")
+    assert numbered == "Post 1:\nFirst post.\n\nPost 2:\nSecond post."
+
+def test_build_digest_reports_the_text_written_so_far():
+    partials = []
+    digest = build_digest(SUMMARIES, "Write a newsletter.", ScriptedModel("Hey ", "there", "!"), partials.append)
+    assert digest == "Hey there!"
+    assert partials == ["Hey ", "Hey there", "Hey there!"]
+
+def test_unchanged_summaries_are_answered_from_the_cache(cache):
+    model = fakes.FakeModel(latency=0, first_chunk_latency=0, stream_chunks=3)
+    digest = build_digest(SUMMARIES, "Write a newsletter.", model, cache=cache)
+    partials = []
+    assert build_digest(SUMMARIES, "Write a newsletter.", model, partials.append, cache) == digest
+    assert model.calls == 1
+    assert partials == [digest]
+
+def test_reordered_summaries_or_another_prompt_miss_the_cache(cache):
+    model = fakes.FakeModel(latency=0, first_chunk_latency=0, stream_chunks=3)
+    build_digest(SUMMARIES, "Write a newsletter.", model, cache=cache)
+    build_digest(SUMMARIES[::-1], "Write a newsletter.", model, cache=cache)
+    build_digest(SUMMARIES, "Write a short newsletter.", model, cache=cache)
+    assert model.calls == 3
+
+def test_without_map_reduce_the_texts_are_joined(monkeypatch):
+    monkeypatch.setattr(semantic_extraction, "MAP_REDUCE_DIGEST", False)
+    assert build_digest(SUMMARIES, "Write a newsletter.", model=None) == "First post.\n\nSecond post."
+
+def test_no_summaries_make_an_empty_digest_without_a_model_call():
+    assert build_digest([], "Write a newsletter.", ScriptedModel("unused")) == ""
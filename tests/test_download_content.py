@@ -0,0 +1,71 @@
+import time
+from types import SimpleNamespace
+import pytest
+import requests
+import download_content
+from download_content import stream_content
+
+BODY = bytes(range(256)) * 40
+
+class BrokenResponse:
+    """Serves `body` from `start` in `chunk_size` pieces, dropping the connection after `fail_after` bytes."""
+
+    def __init__(self, body, start=0, status_code=200, fail_after=None):
+        self.body = body
+        self.start = start
+        self.status_code = status_code
+        self.fail_after = fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        sent = 0
+        for offset in range(self.start, len(self.body), chunk_size):
+            if self.fail_after is not None and sent >= self.fail_after:
+                raise requests.ConnectionError("connection reset")
+            chunk = self.body[offset:offset + chunk_size]
+            sent += len(chunk)
+            yield chunk
+
+class ScriptedSession:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        self.requests.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(download_content, "time", SimpleNamespace(sleep=lambda seconds: None, monotonic=time.monotonic))
+
+def test_resumes_with_a_range_request_after_a_broken_stream():
+    session = ScriptedSession(
+        BrokenResponse(BODY, fail_after=3000),
+        BrokenResponse(BODY, start=3072, status_code=206),
+    )
+    assert b"".join(stream_content(session, "https://cdn.example/a.mp4", chunk_size=1024)) == BODY
+    assert "Range" not in session.requests[0]
+    assert session.requests[1]["Range"] == "bytes=3072-"
+
+def test_skips_bytes_already_received_when_the_server_ignores_range():
+    session = ScriptedSession(
+        BrokenResponse(BODY, fail_after=3000),
+        BrokenResponse(BODY, status_code=200),
+    )
+    assert b"".join(stream_content(session, "https://cdn.example/a.mp4", chunk_size=1000)) == BODY
+    assert session.requests[1]["Range"] == "bytes=3000-"
+
+def test_gives_up_after_max_retries():
+    session = ScriptedSession(*(BrokenResponse(BODY, fail_after=0) for _ in range(3)))
+    with pytest.raises(requests.ConnectionError):
+        b"".join(stream_content(session, "https://cdn.example/a.mp4", chunk_size=1024, max_retries=2))
+    assert len(session.requests) == 3
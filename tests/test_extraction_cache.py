@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+import pytest
+import extraction_cache
+from extraction_cache import SqliteCache, cache_key
+
+class Clock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(extraction_cache, "time", SimpleNamespace(time=clock.time))
+    return clock
+
+def test_cache_key_depends_on_media_prompt_and_model():
+    key = cache_key("md5", "prompt", "model")
+    assert key == cache_key("md5", "prompt", "model")
+    assert key != cache_key("other-md5", "prompt", "model")
+    assert key != cache_key("md5", "other prompt", "model")
+    assert key != cache_key("md5", "prompt", "other-model")
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite3"), ttl=60, max_entries=10)
+    cache.set("key", "summary")
+    clock.now += 59
+    assert cache.get("key") == "summary"
+    clock.now += 2
+    assert cache.get("key") is None
+
+def test_evict_drops_expired_entries(tmp_path, clock):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite3"), ttl=60, max_entries=10)
+    cache.set("old", "stale")
+    clock.now += 30
+    cache.set("new", "fresh")
+    clock.now += 31
+    cache.evict()
+    with cache._connect() as conn:
+        keys = [row[0] for row in conn.execute("SELECT key FROM extraction_cache")]
+    assert keys == ["new"]
+
+def test_evict_keeps_the_most_recently_used_entries(tmp_path, clock):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite3"), ttl=3600, max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key.upper())
+        clock.now += 1
+    # Reading "a" makes "b" the least recently used entry
+    assert cache.get("a") == "A"
+    clock.now += 1
+    cache.evict()
+    assert cache.get("a") == "A"
+    assert cache.get("b") is None
+    assert cache.get("c") == "C"
+
+def test_set_replaces_an_existing_entry(tmp_path, clock):
+    cache = SqliteCache(str(tmp_path / "cache.sqlite3"), ttl=60, max_entries=10)
+    cache.set("key", "first")
+    clock.now += 50
+    cache.set("key", "second")
+    clock.now += 50
+    # Replacing restarts the entry's TTL
+    assert cache.get("key") == "second"
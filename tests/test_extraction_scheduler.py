@@ -0,0 +1,137 @@
+import random
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from google.api_core import exceptions as google_exceptions
+import extraction_scheduler
+from extraction_scheduler import AdaptiveLimiter, AdaptiveScheduler, run_scheduled
+
+@pytest.fixture
+def backoff_sleeps(monkeypatch):
+    """Record the scheduler's backoff delays instead of sleeping through them."""
+    sleeps = []
+    real_sleep = time.sleep
+
+    def fake_sleep(seconds):
+        # Token bucket waits are tiny at the rates used here; let them through
+        if seconds >= 0.5:
+            sleeps.append(seconds)
+        else:
+            real_sleep(seconds)
+
+    # Stand-ins for the module's own references, so time.sleep and random stay untouched everywhere else
+    monkeypatch.setattr(extraction_scheduler, "time", SimpleNamespace(sleep=fake_sleep, monotonic=time.monotonic))
+    monkeypatch.setattr(extraction_scheduler, "random", SimpleNamespace(uniform=lambda low, high: 1.0))
+    return sleeps
+
+def test_run_scheduled_returns_outcomes_in_input_order():
+    def slow_double(item):
+        time.sleep(random.uniform(0, 0.02))
+        return item * 2
+
+    items = list(range(20))
+    outcomes = run_scheduled(slow_double, items, max_concurrency=4, initial_concurrency=4, rate=1000)
+    assert outcomes == [item * 2 for item in items]
+
+def test_run_scheduled_returns_exceptions_in_place():
+    def fail_on_three(item):
+        if item == 3:
+            raise ValueError("bad item")
+        return item
+
+    outcomes = run_scheduled(fail_on_three, [1, 2, 3, 4], rate=1000)
+    assert outcomes[:2] == [1, 2]
+    assert isinstance(outcomes[2], ValueError)
+    assert outcomes[3] == 4
+
+def test_throttled_calls_back_off_exponentially_and_then_succeed(backoff_sleeps):
+    attempts = []
+
+    def throttled_twice(item):
+        attempts.append(item)
+        if len(attempts) <= 2:
+            raise google_exceptions.ResourceExhausted("429")
+        return "ok"
+
+    scheduler = AdaptiveScheduler(throttled_twice, max_concurrency=4, initial_concurrency=4, rate=1000)
+    assert scheduler.call("post") == "ok"
+    assert len(attempts) == 3
+    assert backoff_sleeps == [1.0, 2.0]
+
+def test_throttling_gives_up_after_max_retries(backoff_sleeps):
+    def always_throttled(item):
+        raise google_exceptions.TooManyRequests("429")
+
+    scheduler = AdaptiveScheduler(always_throttled, rate=1000, max_retries=3)
+    outcome = scheduler.call("post")
+    assert isinstance(outcome, google_exceptions.TooManyRequests)
+    assert backoff_sleeps == [1.0, 2.0, 4.0]
+
+def test_other_errors_are_not_retried(backoff_sleeps):
+    attempts = []
+
+    def broken(item):
+        attempts.append(item)
+        raise ValueError("unsupported media")
+
+    outcome = AdaptiveScheduler(broken, rate=1000).call("post")
+    assert isinstance(outcome, ValueError)
+    assert attempts == ["post"]
+    assert backoff_sleeps == []
+
+def test_throttling_halves_the_concurrency_limit(backoff_sleeps):
+    calls = []
+
+    def throttled_once(item):
+        calls.append(item)
+        if len(calls) == 1:
+            raise google_exceptions.ServiceUnavailable("503")
+        return item
+
+    scheduler = AdaptiveScheduler(throttled_once, max_concurrency=8, initial_concurrency=8, rate=1000)
+    scheduler.call("post")
+    assert scheduler.limiter.limit == 4
+
+def test_limiter_halves_down_to_the_minimum():
+    limiter = AdaptiveLimiter(initial=8, maximum=8)
+    limits = []
+    for _ in range(5):
+        limiter.on_throttle()
+        limits.append(limiter.limit)
+    assert limits == [4, 2, 1, 1, 1]
+
+def test_limiter_grows_by_one_per_window_of_successes():
+    limiter = AdaptiveLimiter(initial=2, maximum=3)
+    limiter.on_success()
+    assert limiter.limit == 2
+    limiter.on_success()
+    assert limiter.limit == 3
+    for _ in range(10):
+        limiter.on_success()
+    assert limiter.limit == 3
+
+def test_limiter_caps_in_flight_calls():
+    limiter = AdaptiveLimiter(initial=2, maximum=2)
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        limiter.acquire()
+        try:
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.pop()
+        finally:
+            limiter.release()
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) <= 2
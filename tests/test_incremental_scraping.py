@@ -0,0 +1,45 @@
+import pytest
+import scrape_ig
+import storage_backend
+import download_content
+from benchmarks import fakes
+from scrape_ig import run_instagram_scraper, save_scraped_data
+from download_content import blob_name_for, missing_media_ids
+from storage_backend import StoredObject
+
+USERNAME = "creator"
+
+@pytest.fixture
+def store(monkeypatch):
+    store = fakes.FakeStore(query_latency=0)
+    for name in ("migrate_schema", "get_high_water_mark", "insert_posts"):
+        monkeypatch.setattr(scrape_ig, name, getattr(store, name))
+    monkeypatch.setattr(download_content, "fetch_user_posts", store.fetch_user_posts)
+    return store
+
+@pytest.fixture
+def storage(monkeypatch):
+    storage = fakes.FakeStorage(latency=0)
+    monkeypatch.setattr(storage_backend, "_storage", storage)
+    return storage
+
+def scrape(client):
+    run = run_instagram_scraper(USERNAME, apify_client=client, incremental=True)
+    return save_scraped_data(run, apify_client=client, incremental=True)
+
+def test_second_run_only_asks_for_posts_newer_than_the_high_water_mark(store):
+    client = fakes.FakeApifyClient(posts_per_user=5, actor_latency=0)
+    assert len(scrape(client)) == 5
+    newest = max(row["timestamp"] for row in store.rows)
+    assert scrape_ig.build_actor_input(USERNAME)["onlyPostsNewerThan"] == newest.isoformat()
+    assert scrape(client) == []
+    assert len(store.rows) == 5
+
+def test_missing_media_ids_lists_window_posts_without_a_stored_blob(store, storage):
+    scrape(fakes.FakeApifyClient(posts_per_user=6, actor_latency=0))
+    posts = store.fetch_user_posts(USERNAME)
+    for post in posts[:2]:
+        name = blob_name_for(post["id"], bool(post["video_url"]))
+        storage.objects[name] = StoredObject(name, 1, "md5")
+    # Only the 4 newest posts are in the window; the oldest 2 are ignored even without media
+    assert missing_media_ids(USERNAME, 4) == [post["id"] for post in posts[2:4]]
@@ -0,0 +1,107 @@
+import contextlib
+import pytest
+import instagram_store
+from instagram_store import insert_posts, stream_insert_posts, migrate_schema, MIGRATIONS
+
+def scraped_item(index, display_url=None):
+    return {"ownerUsername": "creator", "caption": f"Post {index}", "url": f"https://www.instagram.com/p/{index}/",
+            "timestamp": "2024-06-01T00:00:00", "videoUrl": None,
+            "displayUrl": display_url or f"https://cdn.fake/{index}.jpg"}
+
+class FakeTable:
+    """Stands in for execute_values against instagram_data, upserting on url like Postgres."""
+
+    def __init__(self):
+        self.rows = {}
+        self.statements = []
+
+    def execute_values(self, cur, query, batch, page_size=None, fetch=False):
+        self.statements.append((query, list(batch)))
+        returned = []
+        for username, caption, url, timestamp, video_url, display_url in batch:
+            inserted = url not in self.rows
+            if inserted:
+                self.rows[url] = {"id": len(self.rows) + 1, "username": username, "timestamp": timestamp}
+            self.rows[url].update(video_url=video_url, display_url=display_url)
+            returned.append(dict(self.rows[url], inserted=inserted))
+        return returned
+
+class Cursor:
+    """Records statements; `SELECT max(version)` answers with `schema_version`."""
+
+    def __init__(self, schema_version=None):
+        self.schema_version = schema_version
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append(" ".join(query.split()))
+
+    def fetchone(self):
+        return (self.schema_version,)
+
+class Connection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def cursor(self, cursor_factory=None):
+        return contextlib.nullcontext(self._cursor)
+
+@pytest.fixture
+def cursor(monkeypatch):
+    cursor = Cursor()
+    monkeypatch.setattr(instagram_store, "db_connection", lambda: contextlib.nullcontext(Connection(cursor)))
+    return cursor
+
+@pytest.fixture
+def table(monkeypatch, cursor):
+    table = FakeTable()
+    monkeypatch.setattr(instagram_store, "execute_values", table.execute_values)
+    return table
+
+def test_existing_posts_are_upserted_but_not_reported_as_new(table):
+    assert insert_posts([scraped_item(1)], track_high_water_marks=False) == [1]
+    assert insert_posts([scraped_item(1, "https://cdn.fake/1.jpg?sig=new"), scraped_item(2)],
+                        track_high_water_marks=False) == [2]
+    query = table.statements[-1][0]
+    assert "ON CONFLICT (url) DO UPDATE" in query
+    assert "(xmax = 0) AS inserted" in query
+    assert table.rows["https://www.instagram.com/p/1/"]["display_url"] == "https://cdn.fake/1.jpg?sig=new"
+
+def test_a_url_repeated_within_a_batch_is_sent_once_with_its_latest_media(table):
+    assert insert_posts([scraped_item(1), scraped_item(1, "https://cdn.fake/1.jpg?sig=new")],
+                        track_high_water_marks=False) == [1]
+    [(_, batch)] = table.statements
+    assert [row[5] for row in batch] == ["https://cdn.fake/1.jpg?sig=new"]
+
+def test_a_lazy_iterator_is_inserted_in_batches_without_being_read_ahead(table):
+    pulled = []
+
+    def items():
+        for index in range(1, 6):
+            pulled.append(index)
+            yield scraped_item(index)
+
+    batches = stream_insert_posts(items(), track_high_water_marks=False, batch_size=2)
+    assert [row["id"] for row in next(batches)] == [1, 2]
+    assert pulled == [1, 2]
+    assert [[row["id"] for row in batch] for batch in batches] == [[3, 4], [5]]
+    assert [len(batch) for _, batch in table.statements] == [2, 2, 1]
+
+def test_high_water_marks_are_updated_once_for_each_user_with_new_posts(table, cursor):
+    items = [scraped_item(1), dict(scraped_item(2), ownerUsername="Other")]
+    assert insert_posts(items, batch_size=1) == [1, 2]
+    marks = [statement for statement in cursor.executed if statement.startswith("INSERT INTO scrape_state")]
+    assert len(marks) == 2
+
+def test_nothing_new_leaves_the_high_water_marks_alone(table, cursor):
+    insert_posts([scraped_item(1)], track_high_water_marks=False)
+    assert insert_posts([scraped_item(1)]) == []
+    assert cursor.executed == []
+
+def test_migrate_schema_applies_only_the_migrations_not_yet_recorded(cursor):
+    cursor.schema_version = 1
+    migrate_schema()
+    applied = [statement for statement in cursor.executed if statement.startswith("INSERT INTO schema_version")]
+    assert len(applied) == len(MIGRATIONS) - 1
+    assert not any("instagram_data_url_key" in statement for statement in cursor.executed)
+    assert any("scrape_state" in statement for statement in cursor.executed)
@@ -0,0 +1,68 @@
+import json
+from types import SimpleNamespace
+import pytest
+import app as app_module
+from jobs import QUEUED, RUNNING, SUCCEEDED, FAILED
+
+class ScriptedStore:
+    """Answers each `get` with the next job snapshot, repeating the last one."""
+
+    def __init__(self, *snapshots):
+        self.snapshots = list(snapshots)
+
+    def get(self, job_id):
+        return self.snapshots.pop(0) if len(self.snapshots) > 1 else self.snapshots[0]
+
+def snapshot(status, summary=None, error=None):
+    return {"id": "job", "username": "creator", "status": status, "error": error, "summary": summary,
+            "stages": {"pipeline": {"status": status}}, "created_at": "", "updated_at": ""}
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(app_module, "JOB_EVENTS_INTERVAL", 0)
+    return app_module.app.test_client()
+
+def use_store(monkeypatch, *snapshots):
+    # A stand-in queue, so the before_request hook starts nothing and no real jobs are touched
+    monkeypatch.setattr(app_module, "job_queue", SimpleNamespace(store=ScriptedStore(*snapshots), start=lambda: None))
+
+def events(response):
+    parsed = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        if "event" in fields:
+            parsed.append((fields["event"], json.loads(fields["data"])))
+    return parsed
+
+def test_unknown_job_is_a_404(client, monkeypatch):
+    use_store(monkeypatch, None)
+    assert client.get("/jobs/missing/events").status_code == 404
+
+def test_a_job_without_summary_text_ends_the_stream_after_its_status(client, monkeypatch):
+    use_store(monkeypatch, snapshot(QUEUED))
+    response = client.get("/jobs/job/events")
+    assert response.get_data(as_text=True).startswith(f"retry: {app_module.JOB_EVENTS_RETRY_MS}\n\n")
+    assert [name for name, _ in events(response)] == ["status"]
+
+def test_summary_is_sent_as_full_text_then_deltas_until_done(client, monkeypatch):
+    use_store(monkeypatch,
+              snapshot(RUNNING),
+              snapshot(RUNNING, "Hey"),
+              snapshot(RUNNING, "Hey there"),
+              snapshot(RUNNING, "Hey there"),
+              # A throttled reduce call restarts the text
+              snapshot(RUNNING, "Hi"),
+              snapshot(SUCCEEDED, "Hi all"))
+    assert events(client.get("/jobs/job/events")) == [
+        ("status", app_module.job_payload(snapshot(RUNNING))),
+        ("summary", {"text": "Hey"}),
+        ("summary", {"delta": " there"}),
+        ("summary", {"text": "Hi"}),
+        ("status", app_module.job_payload(snapshot(SUCCEEDED))),
+        ("summary", {"delta": " all"}),
+        ("done", {"status": SUCCEEDED, "error": None}),
+    ]
+
+def test_a_job_that_disappears_mid_stream_ends_with_done(client, monkeypatch):
+    use_store(monkeypatch, snapshot(RUNNING), snapshot(RUNNING, "Hey"), None)
+    assert events(client.get("/jobs/job/events"))[-1] == ("done", {"status": FAILED, "error": "job not found"})
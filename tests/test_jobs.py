@@ -0,0 +1,52 @@
+import time
+from jobs import JobQueue, JobStore, QUEUED, SUCCEEDED, FAILED
+
+def test_job_created_under_another_stage_layout_reruns_under_the_current_one(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    job_id = store.create("creator", ["scrape", "save", "download", "preprocess", "extract"], owner="gone")
+    with store._connect() as conn:
+        conn.execute("UPDATE jobs SET heartbeat_at = 0 WHERE id = ?", (job_id,))
+
+    def pipeline(context):
+        context["on_progress"]({"extracted": 1})
+        context["summary"] = "digest"
+
+    queue = JobQueue([("pipeline", pipeline)], store=store)
+    queue.start()
+    queue.shutdown()
+    job = store.get(job_id)
+    assert job["status"] == SUCCEEDED
+    assert job["summary"] == "digest"
+    assert list(job["stages"]) == ["pipeline"]
+    assert job["stages"]["pipeline"]["progress"] == {"extracted": 1}
+
+def test_failing_stage_fails_the_job_and_skips_the_rest(tmp_path):
+    def broken(context):
+        raise RuntimeError("scraper down")
+
+    queue = JobQueue([("scrape", broken), ("extract", lambda context: None)], store=JobStore(str(tmp_path / "jobs.sqlite3")))
+    job_id = queue.submit("creator")
+    queue.shutdown()
+    job = queue.store.get(job_id)
+    assert job["status"] == FAILED
+    assert job["error"] == "scraper down"
+    assert [stage["status"] for stage in job["stages"].values()] == ["failed", "skipped"]
+
+def test_job_orphaned_after_start_is_resumed_once_its_lease_expires(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    # The previous process just died, so its lease is still fresh when the new one starts
+    job_id = store.create("creator", ["pipeline"], owner="crashed")
+
+    def pipeline(context):
+        context["summary"] = "digest"
+
+    queue = JobQueue([("pipeline", pipeline)], store=store, lease=0.3, heartbeat_interval=0.05)
+    queue.start()
+    assert store.get(job_id)["status"] == QUEUED
+    deadline = time.time() + 5
+    while store.get(job_id)["status"] != SUCCEEDED and time.time() < deadline:
+        time.sleep(0.05)
+    queue.shutdown()
+    job = store.get(job_id)
+    assert job["status"] == SUCCEEDED
+    assert job["owner"] == queue.owner
@@ -0,0 +1,35 @@
+import pytest
+import preprocess_media
+from preprocess_media import artifact_name_for, get_preprocess_pool
+
+@pytest.mark.parametrize("setting, value", [
+    ("PREPROCESS_MAX_IMAGE_SIDE", 1024),
+    ("PREPROCESS_JPEG_QUALITY", 60),
+    ("PREPROCESS_VIDEO_HEIGHT", 480),
+    ("PREPROCESS_VIDEO_FPS", 2.0),
+    ("PREPROCESS_KEYFRAMES", 4),
+])
+def test_changing_a_setting_changes_the_artifact_name(monkeypatch, setting, value):
+    before = artifact_name_for("instagram_content/7.mp4")
+    monkeypatch.setattr(preprocess_media, setting, value)
+    after = artifact_name_for("instagram_content/7.mp4")
+    assert before != after
+    assert after.startswith("instagram_preprocessed/7-")
+
+def test_artifact_extension_follows_the_video_mode(monkeypatch):
+    monkeypatch.setattr(preprocess_media, "PREPROCESS_VIDEO_MODE", "keyframes")
+    assert artifact_name_for("instagram_content/7.mp4").endswith(".jpg")
+    assert artifact_name_for("instagram_content/8.jpg").endswith(".jpg")
+
+@pytest.fixture
+def no_pool(monkeypatch):
+    monkeypatch.setattr(preprocess_media, "_pool", None)
+    yield
+    preprocess_media.shutdown_preprocess_pool()
+
+def test_one_pool_is_shared_until_it_breaks(no_pool):
+    # Children are only spawned on the first submit, so nothing starts here
+    pool = get_preprocess_pool()
+    assert get_preprocess_pool() is pool
+    pool._broken = "a child process terminated abruptly"
+    assert get_preprocess_pool() is not pool
@@ -0,0 +1,78 @@
+import threading
+import time
+import pytest
+from psycopg2 import pool as pg_pool
+import resources
+
+class Connection:
+    closed = 0
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+class StrictPool:
+    """Raises like ThreadedConnectionPool once `maxconn` connections are lent out."""
+
+    def __init__(self, maxconn):
+        self.maxconn = maxconn
+        self.lent = 0
+        self.most_lent = 0
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        with self._lock:
+            if self.lent >= self.maxconn:
+                raise pg_pool.PoolError("connection pool exhausted")
+            self.lent += 1
+            self.most_lent = max(self.most_lent, self.lent)
+        return Connection()
+
+    def putconn(self, conn, close=False):
+        with self._lock:
+            self.lent -= 1
+
+@pytest.fixture
+def db_pool(monkeypatch):
+    db_pool = StrictPool(maxconn=2)
+    monkeypatch.setattr(resources, "_db_pool", db_pool)
+    monkeypatch.setattr(resources, "_db_slots", threading.BoundedSemaphore(2))
+    return db_pool
+
+def test_borrowers_wait_for_a_free_connection_instead_of_failing(db_pool):
+    errors = []
+
+    def borrow():
+        try:
+            with resources.db_connection():
+                time.sleep(0.02)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=borrow) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert db_pool.most_lent == 2
+    assert db_pool.lent == 0
+
+def test_a_failing_borrower_returns_its_connection(db_pool):
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            with resources.db_connection():
+                raise ValueError("bad query")
+    assert db_pool.lent == 0
+
+def test_http_pool_grows_to_the_largest_caller(monkeypatch):
+    monkeypatch.setattr(resources, "_http_session", None)
+    monkeypatch.setattr(resources, "_http_pool_size", 0)
+    monkeypatch.setattr(resources, "HTTP_POOL_SIZE", 0)
+    session = resources.get_http_session(16)
+    assert resources.get_http_session(8) is session
+    assert session.get_adapter("https://cdn.example/")._pool_maxsize == 16
+    resources.get_http_session(24)
+    assert session.get_adapter("https://cdn.example/")._pool_maxsize == 24
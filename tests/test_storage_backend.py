@@ -0,0 +1,113 @@
+import base64
+import hashlib
+import os
+import google_crc32c
+import pytest
+import storage_backend
+import download_content
+from download_content import download_and_store_content, blob_name_for
+from storage_backend import LocalBackend, StoredObject
+
+BODY = b"media bytes " * 1000
+
+def md5_of(data):
+    return base64.b64encode(hashlib.md5(data).digest()).decode()
+
+def crc32c_of(data):
+    return base64.b64encode(google_crc32c.Checksum(data).digest()).decode()
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = LocalBackend(str(tmp_path / "media"))
+    monkeypatch.setattr(storage_backend, "_storage", storage)
+    return storage
+
+def write(storage, name, data):
+    writer = storage.open_writer(name, "image/jpeg")
+    writer.write(data)
+    writer.close()
+
+def test_written_objects_are_read_back_with_their_md5(storage):
+    write(storage, "instagram_content/1.jpg", BODY)
+    assert storage.read_bytes("instagram_content/1.jpg") == BODY
+    assert storage.stat("instagram_content/1.jpg") == StoredObject("instagram_content/1.jpg", len(BODY), md5_of(BODY))
+
+def test_empty_objects_are_readable(storage):
+    write(storage, "instagram_content/empty.jpg", b"")
+    assert storage.read_bytes("instagram_content/empty.jpg") == b""
+    assert storage.stat("instagram_content/empty.jpg").size == 0
+
+def test_missing_objects_stat_as_none(storage):
+    assert storage.stat("instagram_content/missing.jpg") is None
+
+def test_an_aborted_write_leaves_nothing_behind(storage):
+    writer = storage.open_writer("instagram_content/1.mp4", "video/mp4")
+    writer.write(BODY)
+    writer.abort()
+    assert os.listdir(os.path.join(storage.root, "instagram_content")) == []
+    assert storage.stat("instagram_content/1.mp4") is None
+
+def test_list_skips_unfinished_uploads_and_filters_by_prefix(storage):
+    write(storage, "instagram_content/2.jpg", BODY)
+    write(storage, "instagram_content/1.jpg", BODY)
+    write(storage, "preprocessed/1.jpg", BODY)
+    storage.open_writer("instagram_content/3.mp4", "video/mp4").write(BODY)
+    assert [stored.name for stored in storage.list("instagram_content/")] == [
+        "instagram_content/1.jpg", "instagram_content/2.jpg",
+    ]
+
+@pytest.mark.parametrize("name", ["../outside.jpg", "/etc/passwd", "instagram_content/../../outside.jpg"])
+def test_names_escaping_the_root_are_rejected(storage, name):
+    with pytest.raises(ValueError):
+        storage.open_writer(name, "image/jpeg")
+
+class Response:
+    status_code = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        for offset in range(0, len(BODY), chunk_size):
+            yield BODY[offset:offset + chunk_size]
+
+class Session:
+    def get(self, url, headers=None, stream=False, timeout=None):
+        return Response()
+
+class ReportingBackend(LocalBackend):
+    """Local storage that reports the hashes a remote backend would, given as `md5_hash` and `crc32c`."""
+
+    def __init__(self, root, md5_hash, crc32c=None):
+        super().__init__(root)
+        self.reported = (md5_hash, crc32c)
+
+    def stat(self, name):
+        stored = super().stat(name)
+        return stored and StoredObject(name, stored.size, *self.reported)
+
+def download(storage, monkeypatch):
+    monkeypatch.setattr(storage_backend, "_storage", storage)
+    return download_and_store_content("https://cdn.example/1.jpg", 1, False, Session(), download_content.HostLimiter())
+
+def test_download_is_checked_against_the_stored_md5(storage, monkeypatch):
+    result = download(storage, monkeypatch)
+    assert result.success and result.bytes == len(BODY)
+    assert storage.read_bytes(blob_name_for(1, False)) == BODY
+
+def test_download_is_checked_against_crc32c_when_there_is_no_md5(tmp_path, monkeypatch):
+    assert download(ReportingBackend(str(tmp_path), None, crc32c_of(BODY)), monkeypatch).success
+
+@pytest.mark.parametrize("md5_hash, crc32c", [(md5_of(b"other"), crc32c_of(BODY)), (None, crc32c_of(b"other"))])
+def test_a_checksum_mismatch_deletes_the_upload(tmp_path, monkeypatch, md5_hash, crc32c):
+    storage = ReportingBackend(str(tmp_path), md5_hash, crc32c)
+    result = download(storage, monkeypatch)
+    assert not result.success
+    assert "Checksum mismatch" in result.error
+    assert not os.path.exists(os.path.join(storage.root, blob_name_for(1, False)))
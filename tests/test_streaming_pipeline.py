@@ -0,0 +1,123 @@
+import threading
+from datetime import datetime, timedelta
+import pytest
+import resources
+import storage_backend
+import download_content
+import streaming_pipeline
+from benchmarks import fakes
+from streaming_pipeline import StreamingPipeline
+
+USERNAME = "creator"
+
+def scraped_items(count):
+    now = datetime(2024, 6, 1)
+    return [{
+        "ownerUsername": USERNAME,
+        "caption": f"Post {index}",
+        "url": f"https://www.instagram.com/p/{index}/",
+        "timestamp": (now - timedelta(days=index)).isoformat(),
+        "videoUrl": None,
+        "displayUrl": f"https://cdn.fake/{index}.jpg",
+    } for index in range(count)]
+
+@pytest.fixture
+def store(monkeypatch):
+    store = fakes.FakeStore(query_latency=0)
+    monkeypatch.setattr(storage_backend, "_storage", fakes.FakeStorage(latency=0, bandwidth=1e12))
+    monkeypatch.setattr(resources, "_http_session", fakes.FakeSession(0, 1e12, video_size=1024, image_size=1024))
+    monkeypatch.setattr(streaming_pipeline, "stream_insert_posts", store.stream_insert_posts)
+    monkeypatch.setattr(download_content, "fetch_user_posts", store.fetch_user_posts)
+    monkeypatch.setattr(streaming_pipeline, "stream_scraped_pages", lambda username: iter([scraped_items(4)]))
+    monkeypatch.setattr(streaming_pipeline, "get_cache", lambda: None)
+    return store
+
+def run_pipeline(**options):
+    """Run a pipeline on a watchdog thread so a hang fails the test instead of stalling the suite."""
+    progress = []
+    pipeline = StreamingPipeline(USERNAME, "Write a newsletter.", model=fakes.FakeModel(latency=0.01, first_chunk_latency=0),
+                                 download_workers=2, on_progress=progress.append, **options)
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = pipeline.run()
+        except Exception as e:
+            outcome["error"] = e
+
+    runner = threading.Thread(target=target)
+    runner.start()
+    runner.join(timeout=30)
+    assert not runner.is_alive(), "pipeline did not shut down"
+    leftover = [thread.name for thread in threading.enumerate() if thread.name.startswith("stream-")]
+    assert leftover == []
+    return outcome, progress[-1] if progress else None
+
+def test_every_post_is_downloaded_and_summarised(store):
+    outcome, progress = run_pipeline()
+    assert outcome["result"]
+    assert progress == {"new_posts": 4, "downloaded": 4, "download_failed": 0, "extracted": 4, "extract_failed": 0}
+
+def test_producer_failure_stops_the_workers_and_is_raised(store, monkeypatch):
+    def broken_pages(username):
+        yield scraped_items(2)
+        raise RuntimeError("actor run failed")
+
+    monkeypatch.setattr(streaming_pipeline, "stream_scraped_pages", broken_pages)
+    outcome, _ = run_pipeline()
+    assert str(outcome["error"]) == "actor run failed"
+
+def test_window_listing_failure_stops_the_workers_and_is_raised(store, monkeypatch):
+    def broken_window(username, limit):
+        raise ConnectionError("database went away")
+
+    monkeypatch.setattr(streaming_pipeline, "fetch_window_posts", broken_window)
+    outcome, _ = run_pipeline()
+    assert isinstance(outcome["error"], ConnectionError)
+
+def test_download_worker_errors_are_counted_and_skipped(store, monkeypatch):
+    real_download = streaming_pipeline.download_and_store_content
+
+    def flaky_download(url, id, is_video, session=None, host_limiter=None):
+        if id == 2:
+            raise OSError("storage unavailable")
+        return real_download(url, id, is_video, session, host_limiter)
+
+    monkeypatch.setattr(streaming_pipeline, "download_and_store_content", flaky_download)
+    outcome, progress = run_pipeline()
+    assert outcome["result"]
+    assert progress["download_failed"] == 1
+    assert progress["extracted"] == 3
+
+def test_extract_worker_errors_are_counted_and_skipped(store, monkeypatch):
+    def broken_extract(blob_name, prompt, scheduler, cache=None):
+        raise ValueError("unsupported media")
+
+    monkeypatch.setattr(streaming_pipeline, "extract_one", broken_extract)
+    outcome, progress = run_pipeline()
+    assert outcome["result"] == ""
+    assert progress["extract_failed"] == 4
+
+def test_a_full_download_queue_does_not_block_shutdown(store, monkeypatch):
+    monkeypatch.setattr(streaming_pipeline, "stream_scraped_pages", lambda username: iter([scraped_items(12)]))
+
+    def broken_download(url, id, is_video, session=None, host_limiter=None):
+        raise OSError("storage unavailable")
+
+    monkeypatch.setattr(streaming_pipeline, "download_and_store_content", broken_download)
+    outcome, progress = run_pipeline(window=12, queue_size=1)
+    assert progress["download_failed"] == 12
+
+def test_a_failing_progress_callback_does_not_stop_the_workers(store, monkeypatch):
+    monkeypatch.setattr(streaming_pipeline, "stream_scraped_pages", lambda username: iter([scraped_items(12)]))
+
+    def broken_progress(counts):
+        raise RuntimeError("database is locked")
+
+    pipeline = StreamingPipeline(USERNAME, "Write a newsletter.", model=fakes.FakeModel(latency=0, first_chunk_latency=0),
+                                 window=12, download_workers=2, queue_size=1, on_progress=broken_progress)
+    runner = threading.Thread(target=pipeline.run)
+    runner.start()
+    runner.join(timeout=30)
+    assert not runner.is_alive(), "pipeline did not shut down"
+    assert pipeline.progress["extracted"] == 12
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+import contextlib
+import functools
+from collections import defaultdict
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv('.env.development.local')
+
+# Directory for per-run JSON reports; unset keeps reports only in the job store
+TRACE_REPORT_DIR = os.getenv("TRACE_REPORT_DIR")
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Span:
+    stage: str
+    item: Optional[str] = None
+    started_at: float = field(default_factory=time.time)
+    duration: float = 0.0
+    bytes: int = 0
+    retries: int = 0
+    error: Optional[str] = None
+    attributes: dict = field(default_factory=dict)
+
+class StageTotals:
+    """Running totals for one stage, shared by the process-wide registry and run traces."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.retries = 0
+        self.errors = 0
+
+    def add(self, span):
+        self.count += 1
+        self.seconds += span.duration
+        self.bytes += span.bytes
+        self.retries += span.retries
+        self.errors += 1 if span.error else 0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "seconds": round(self.seconds, 6),
+            "bytes": self.bytes,
+            "retries": self.retries,
+            "errors": self.errors,
+        }
+
+class RunTrace:
+    """Every span recorded while one pipeline run is active, plus its report."""
+
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.started_at = time.time()
+        self.finished_at = None
+        self.spans = []
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def report(self):
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+        totals = defaultdict(StageTotals)
+        for span in spans:
+            totals[span.stage].add(span)
+        finished_at = self.finished_at or time.time()
+        return {
+            "run_id": self.run_id,
+            "started_at": self.started_at,
+            "duration": round(finished_at - self.started_at, 6),
+            "stages": {stage: stage_totals.as_dict() for stage, stage_totals in totals.items()},
+            "counters": counters,
+            "spans": [asdict(span) for span in spans],
+        }
+
+class MetricsRegistry:
+    """Process-wide totals across all runs, exposed on /metrics."""
+
+    def __init__(self):
+        self.stages = defaultdict(StageTotals)
+        self.counters = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, span):
+        with self._lock:
+            self.stages[span.stage].add(span)
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def prometheus(self):
+        """Render totals in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            stages = {stage: totals.as_dict() for stage, totals in self.stages.items()}
+            counters = dict(self.counters)
+        for metric, key, help_text in (
+            ("buildspace_stage_spans_total", "count", "Spans recorded per stage"),
+            ("buildspace_stage_seconds_total", "seconds", "Time spent per stage"),
+            ("buildspace_stage_bytes_total", "bytes", "Bytes transferred per stage"),
+            ("buildspace_stage_retries_total", "retries", "Retries per stage"),
+            ("buildspace_stage_errors_total", "errors", "Failed spans per stage"),
+        ):
+            lines.append(f"# HELP {metric} {help_text}")
+            lines.append(f"# TYPE {metric} counter")
+            for stage, totals in sorted(stages.items()):
+                lines.append(f'{metric}{{stage="{stage}"}} {totals[key]}')
+        lines.append("# HELP buildspace_events_total Pipeline event counters")
+        lines.append("# TYPE buildspace_events_total counter")
+        for name, value in sorted(counters.items()):
+            lines.append(f'buildspace_events_total{{event="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+_current_run = contextvars.ContextVar("current_run", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+@contextlib.contextmanager
+def run(run_id):
+    """Collect every span recorded in this context (and in bound workers) into a RunTrace."""
+    trace = RunTrace(run_id)
+    token = _current_run.set(trace)
+    try:
+        yield trace
+    finally:
+        trace.finished_at = time.time()
+        _current_run.reset(token)
+        if TRACE_REPORT_DIR:
+            # The report is a by-product; failing to write it must not fail the run
+            try:
+                os.makedirs(TRACE_REPORT_DIR, exist_ok=True)
+                with open(os.path.join(TRACE_REPORT_DIR, f"{run_id}.json"), "w") as f:
+                    json.dump(trace.report(), f, indent=2, default=str)
+            except Exception as e:
+                logger.error(f"Failed to write trace report for run {run_id}: {str(e)}")
+
+@contextlib.contextmanager
+def span(stage, item=None, **attributes):
+    """Time a unit of work; callers may add to `bytes`, `retries` and `attributes` as it runs."""
+    current = Span(stage, None if item is None else str(item), attributes=attributes)
+    token = _current_span.set(current)
+    started = time.monotonic()
+    try:
+        yield current
+    except Exception as e:
+        current.error = str(e)
+        raise
+    finally:
+        current.duration = time.monotonic() - started
+        _current_span.reset(token)
+        registry.record(current)
+        trace = _current_run.get()
+        if trace is not None:
+            trace.record(current)
+
+def current_span():
+    return _current_span.get()
+
+def add_retry():
+    """Count a retry against the innermost span, if any."""
+    active = _current_span.get()
+    if active is not None:
+        active.retries += 1
+
+def increment(name, value=1):
+    registry.increment(name, value)
+    trace = _current_run.get()
+    if trace is not None:
+        trace.increment(name, value)
+
+def bind(fn):
+    """Wrap `fn` so it records into the caller's run when executed on a pool thread."""
+    trace = _current_run.get()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _current_run.set(trace)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current_run.reset(token)
+    return wrapper